@@ -6,13 +6,14 @@
 */
 module tb ();
 
-  // Dump the signals to a VCD file. You can view it with gtkwave or surfer.
+  // No waves are dumped by default; run with WAVES=1 (see README.md) to get
+  // sim_build/rtl/tb.fst for gtkwave or surfer.
 
   localparam integer ADDRW_TB  = 24;
   localparam integer OPCODEW_TB = 2;
   localparam integer QDEPTH_TB = 16;
   // Wire up the inputs and outputs:
-  wire clk;
+  reg clk;
   wire rst_n;
   wire valid_in;
   wire ready_in_aes;
@@ -23,6 +24,11 @@ module tb ();
   wire [ADDRW_TB-1:0] text_addr;
   wire [ADDRW_TB-1:0] dest_addr;
 
+  // Packed request fields, same layout as pack_instr() in test.py, so the
+  // testbench drives a whole request with a single VPI write.
+  wire [3*ADDRW_TB+OPCODEW_TB-1:0] instr_in;
+  assign {opcode, key_addr, text_addr, dest_addr} = instr_in;
+
   wire [3*ADDRW_TB+OPCODEW_TB-1:0] instr_aes;
   wire valid_out_aes;
   wire ready_out_aes;
@@ -53,10 +59,11 @@ module tb ();
       .ready_out_sha(ready_out_sha)
   );
 
+  // Clock generation (10ns period = 100MHz), kept in HDL so no Python
+  // coroutine has to toggle clk through the VPI on every edge.
   initial begin
-    $dumpfile("tb.vcd");
-    $dumpvars(0, tb);
-    #1;
+    clk = 0;
+    forever #5 clk = ~clk;
   end
 
 endmodule
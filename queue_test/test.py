@@ -1,7 +1,12 @@
 import random
+from collections import deque
+from types import SimpleNamespace
 import cocotb
-from cocotb.clock import Clock
-from cocotb.triggers import ClockCycles, RisingEdge
+from cocotb.binary import BinaryValue
+from cocotb.regression import TestFactory
+from cocotb.triggers import (
+    ClockCycles, FallingEdge, NextTimeStep, ReadOnly, RisingEdge, Timer, with_timeout,
+)
 
 ADDRW   = 24
 OPCODEW = 2
@@ -11,18 +16,76 @@ QDEPTH  = 16
 AES = 0  # opcode[0] == 0
 SHA = 1  # opcode[0] == 1
 
+# (opcode, key, text, dest) for the single enqueue/dequeue checks
+SINGLE_VECTORS = [
+    (0b00, 0x000001, 0x000002, 0x000003),  # AES
+    (0b01, 0xABCDEF, 0x012345, 0x6789AB),  # SHA
+]
+
+
+# Field offsets inside a packed instruction
+OPC_SHIFT  = 3 * ADDRW
+KEY_SHIFT  = 2 * ADDRW
+TEXT_SHIFT = ADDRW
+
 
 def pack_instr(opc, key, text, dest):
-    """Pack fields to match RTL: {opcode, key_addr, text_addr, dest_addr}"""
-    assert 0 <= opc  < (1 << OPCODEW)
-    assert 0 <= key  < (1 << ADDRW)
-    assert 0 <= text < (1 << ADDRW)
-    assert 0 <= dest < (1 << ADDRW)
-    return (opc << (3 * ADDRW)) | (key << (2 * ADDRW)) | (text << ADDRW) | dest
+    """
+    Pack fields to match RTL: {opcode, key_addr, text_addr, dest_addr}
+    Fields are not range-checked; every caller already draws them within
+    OPCODEW/ADDRW bits.
+    """
+    return (opc << OPC_SHIFT) | (key << KEY_SHIFT) | (text << TEXT_SHIFT) | dest
+
+
+def pack_sha_instr(opc, text, dest):
+    """
+    Pack a SHA queue entry to match RTL: {opcode, text_addr, dest_addr}
+    The SHA queue does not store key_addr, so instr_sha carries this 50-bit
+    entry zero-extended; compare SHA heads against this, not pack_instr().
+    """
+    return (opc << KEY_SHIFT) | (text << TEXT_SHIFT) | dest
 
 
 def get_int(sig):
-    return int(sig.value)
+    return sig.value.integer
+
+
+def instr_value(instr):
+    """
+    Pre-build the BinaryValue for a packed instruction.
+    instr_in is wider than 32 bits, so cocotb converts a plain int into a new
+    BinaryValue on every write; constants driven repeatedly are built once.
+    """
+    return BinaryValue(instr, n_bits=INSTRW, bigEndian=False)
+
+
+# Golden instructions for the directed tests; each is driven and then
+# compared against the queue head, so pack them once at import
+PUSH_POP_AES   = pack_instr(0b00, 0x444, 0x555, 0x666)
+PUSH_POP_SHA   = pack_instr(0b01, 0xAAA, 0xBBB, 0xCCC)
+POST_RESET_AES = pack_instr(0b00, 0xABC, 0xDEF, 0x123)
+UNDEF_OPC_10   = pack_instr(0b10, 0x100, 0x200, 0x300)
+UNDEF_OPC_11   = pack_instr(0b11, 0x400, 0x500, 0x600)
+# ... and what the SHA queue head shows for the SHA ones
+PUSH_POP_SHA_ENTRY = pack_sha_instr(0b01, 0xBBB, 0xCCC)
+UNDEF_OPC_11_ENTRY = pack_sha_instr(0b11, 0x500, 0x600)
+
+IDLE_INSTR = instr_value(0)
+
+
+def check_status(dut, valid_aes, valid_sha, ready_aes, ready_sha, when):
+    """Check valid_out_*/ready_out_* of both queues with a single assert."""
+    actual = (
+        dut.valid_out_aes.value.integer,
+        dut.valid_out_sha.value.integer,
+        dut.ready_out_aes.value.integer,
+        dut.ready_out_sha.value.integer,
+    )
+    expected = (valid_aes, valid_sha, ready_aes, ready_sha)
+    assert actual == expected, (
+        f"{when}: (valid_aes, valid_sha, ready_aes, ready_sha) = {actual}, expected {expected}"
+    )
 
 
 async def reset(dut):
@@ -30,16 +93,103 @@ async def reset(dut):
     dut.valid_in.value     = 0
     dut.ready_in_aes.value = 0
     dut.ready_in_sha.value = 0
-    dut.opcode.value       = 0
-    dut.key_addr.value     = 0
-    dut.text_addr.value    = 0
-    dut.dest_addr.value    = 0
+    dut.instr_in.value     = IDLE_INSTR
     dut.rst_n.value        = 0
-    await ClockCycles(dut.clk, 5)
+    # rst_n is asynchronous, so hold it for a plain 5-cycle timer and only
+    # sync to clk for the release
+    await Timer(50, "ns")
+    await RisingEdge(dut.clk)
     dut.rst_n.value        = 1
     await ClockCycles(dut.clk, 2)
 
 
+async def setup(dut):
+    """
+    Reset the DUT and return its handles in one namespace.
+    Every test starts with this, so the handle lookups through dut are done
+    once here instead of being repeated at the top of each test.
+    """
+    await reset(dut)
+    return SimpleNamespace(
+        clk=dut.clk,
+        rst_n=dut.rst_n,
+        instr_in=dut.instr_in,
+        valid_in=dut.valid_in,
+        ready_in_aes=dut.ready_in_aes,
+        ready_in_sha=dut.ready_in_sha,
+        ready_out_aes=dut.ready_out_aes,
+        ready_out_sha=dut.ready_out_sha,
+        valid_out_aes=dut.valid_out_aes,
+        valid_out_sha=dut.valid_out_sha,
+        instr_aes=dut.instr_aes,
+        instr_sha=dut.instr_sha,
+    )
+
+
+async def drain(valid_line, ready_line, timeout_ns=20 * QDEPTH):
+    """
+    Hold ready_in high until the queue reports empty.
+    Waits on the DUT's own valid_out falling edge instead of sampling it every
+    cycle, so Python is only woken once the last entry has been popped.
+    """
+    if valid_line.value.integer == 0:
+        return
+    ready_line.value = 1
+    await with_timeout(FallingEdge(valid_line), timeout_ns, "ns")
+    ready_line.value = 0
+
+
+async def stream_fill(clk, instr_in, valid_in, instrs):
+    """
+    Push packed instructions back-to-back, one per clock, with valid_in held
+    high. Unlike push_if_ready() there is no ready sample, so the caller must
+    know the queue has room for all of them.
+    """
+    valid_in.value = 1
+    for instr in instrs:
+        instr_in.value = instr
+        await RisingEdge(clk)
+    valid_in.value = 0
+
+
+async def stream_drain(clk, valid_line, instr_line, ready_line, golden):
+    """
+    Pop len(golden) entries back-to-back with ready_in held high.
+    Each head is checked mid-cycle, on the falling edge before the rising edge
+    that pops it, so every entry costs one clock instead of a sample edge plus
+    a separate pop pulse.
+    """
+    # req_queue advances its read pointer whenever ready_in is high, even when
+    # empty, so never raise ready for an empty drain
+    if not golden:
+        return
+    ready_line.value = 1
+    for i, expected in enumerate(golden):
+        await FallingEdge(clk)
+        assert valid_line.value.integer == 1, f"Entry {i}: queue empty"
+        actual = get_int(instr_line)
+        assert actual == expected, f"Entry {i}: expected {expected:x}, got {actual:x}"
+    await RisingEdge(clk)
+    ready_line.value = 0
+
+
+async def pop_checked(clk, valid_line, instr_line, ready_line, expected):
+    """
+    Check the queue head mid-cycle and pop it on the next rising edge, so a
+    checked pop takes one clock. Returns False, without popping, if the queue
+    reports empty. Always returns just after a rising edge.
+    """
+    await FallingEdge(clk)
+    popped = valid_line.value.integer == 1
+    if popped:
+        actual = get_int(instr_line)
+        assert actual == expected, f"Head mismatch: expected {expected:x}, got {actual:x}"
+        ready_line.value = 1
+    await RisingEdge(clk)
+    ready_line.value = 0
+    return popped
+
+
 async def push_if_ready(dut, opc, key, text, dest, should_accept=True):
     """
     Drives a 1-cycle valid_in with the given instruction.
@@ -51,14 +201,11 @@ async def push_if_ready(dut, opc, key, text, dest, should_accept=True):
     ready_line = dut.ready_out_sha if is_sha else dut.ready_out_aes
 
     # Drive fields
-    dut.opcode.value    = opc
-    dut.key_addr.value  = key
-    dut.text_addr.value = text
-    dut.dest_addr.value = dest
+    dut.instr_in.value = pack_instr(opc, key, text, dest)
 
     # Sample ready before asserting valid
     await RisingEdge(dut.clk)
-    ready_now = int(ready_line.value)
+    ready_now = ready_line.value.integer
 
     dut.valid_in.value = 1
     await RisingEdge(dut.clk)
@@ -73,7 +220,7 @@ async def push_if_ready(dut, opc, key, text, dest, should_accept=True):
 async def pop_aes(dut, expect_valid=True):
     """Pop one AES entry (1-cycle ready_in_aes) and check valid_out_aes behavior."""
     await RisingEdge(dut.clk)
-    valid = int(dut.valid_out_aes.value)
+    valid = dut.valid_out_aes.value.integer
     if expect_valid:
         assert valid == 1, "Expected AES valid_out=1 before pop"
     else:
@@ -86,7 +233,7 @@ async def pop_aes(dut, expect_valid=True):
 async def pop_sha(dut, expect_valid=True):
     """Pop one SHA entry (1-cycle ready_in_sha) and check valid_out_sha behavior."""
     await RisingEdge(dut.clk)
-    valid = int(dut.valid_out_sha.value)
+    valid = dut.valid_out_sha.value.integer
     if expect_valid:
         assert valid == 1, "Expected SHA valid_out=1 before pop"
     else:
@@ -96,58 +243,51 @@ async def pop_sha(dut, expect_valid=True):
     dut.ready_in_sha.value = 0
 
 
-@cocotb.test()
-async def req_queue_full_suite(dut):
-    """Comprehensive directed + random test for req_queue."""
+async def single_enqueue_dequeue(dut, vector):
+    """Push one instruction, check it at the head of its queue, then pop it."""
+    opc, key, text, dest = vector
+    is_sha = (opc & 1) == 1
+    golden = pack_sha_instr(opc, text, dest) if is_sha else pack_instr(opc, key, text, dest)
 
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
-    await reset(dut)
+    h = await setup(dut)
+    valid_line = h.valid_out_sha if is_sha else h.valid_out_aes
+    instr_line = h.instr_sha if is_sha else h.instr_aes
 
-    # --- 1) Reset behavior ----------------------------------------------------
-    assert int(dut.valid_out_aes.value) == 0
-    assert int(dut.valid_out_sha.value) == 0
-    assert int(dut.ready_out_aes.value) == 1  # not full
-    assert int(dut.ready_out_sha.value) == 1
+    await push_if_ready(dut, opc, key, text, dest, should_accept=True)
+    await RisingEdge(h.clk)
+    assert valid_line.value.integer == 1
+    assert get_int(instr_line) == golden
 
-    # --- 2) Single AES enqueue/dequeue ----------------------------------------
-    opc = 0b00  # AES
-    key, text, dest = 0x000001, 0x000002, 0x000003
-    golden = pack_instr(opc, key, text, dest)
+    await (pop_sha if is_sha else pop_aes)(dut, expect_valid=True)
+    await RisingEdge(h.clk)
+    assert valid_line.value.integer == 0
 
-    await push_if_ready(dut, opc, key, text, dest, should_accept=True)
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 1
-    assert get_int(dut.instr_aes) == golden
 
-    await pop_aes(dut, expect_valid=True)
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 0
+# One independent test per vector, so each can be selected with TESTCASE=
+# and run in its own simulator process.
+single_factory = TestFactory(single_enqueue_dequeue)
+single_factory.add_option("vector", SINGLE_VECTORS)
+single_factory.generate_tests()
 
-    # --- 3) Single SHA enqueue/dequeue ----------------------------------------
-    opc = 0b01  # SHA
-    key, text, dest = 0xABCDEF, 0x012345, 0x6789AB
-    golden = pack_instr(opc, key, text, dest)
 
-    await push_if_ready(dut, opc, key, text, dest, should_accept=True)
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_sha.value) == 1
-    assert get_int(dut.instr_sha) == golden
+@cocotb.test()
+async def req_queue_full_suite(dut):
+    """Comprehensive directed + random test for req_queue."""
+    h = await setup(dut)
 
-    await pop_sha(dut, expect_valid=True)
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_sha.value) == 0
+    # --- 1) Reset behavior ----------------------------------------------------
+    check_status(dut, 0, 0, 1, 1, when="after reset")
 
-    # --- 4) Interleaved writes: ordering per-queue ----------------------------
-    aes_model = []
-    sha_model = []
+    # --- 2) Interleaved writes: ordering per-queue ----------------------------
+    aes_model = deque()
+    sha_model = deque()
 
     async def enqueue_and_track(opc, key, text, dest):
         await push_if_ready(dut, opc, key, text, dest, should_accept=True)
-        instr = pack_instr(opc, key, text, dest)
         if (opc & 1) == 1:
-            sha_model.append(instr)
+            sha_model.append(pack_sha_instr(opc, text, dest))
         else:
-            aes_model.append(instr)
+            aes_model.append(pack_instr(opc, key, text, dest))
 
     for i in range(4):
         opc = AES if (i % 2 == 0) else SHA
@@ -158,706 +298,481 @@ async def req_queue_full_suite(dut):
 
     # Pop one from each and check top-of-queue matches model[0]
     if aes_model:
-        await RisingEdge(dut.clk)
-        assert int(dut.valid_out_aes.value) == 1
-        assert get_int(dut.instr_aes) == aes_model[0]
-        await pop_aes(dut, expect_valid=True)
-        aes_model.pop(0)
+        assert await pop_checked(h.clk, h.valid_out_aes, h.instr_aes, h.ready_in_aes, aes_model[0])
+        aes_model.popleft()
 
     if sha_model:
-        await RisingEdge(dut.clk)
-        assert int(dut.valid_out_sha.value) == 1
-        assert get_int(dut.instr_sha) == sha_model[0]
-        await pop_sha(dut, expect_valid=True)
-        sha_model.pop(0)
-
-    # --- Clean up remaining items from section 4 ------------------------------
-    while len(aes_model) > 0:
-        await RisingEdge(dut.clk)
-        assert int(dut.valid_out_aes.value) == 1
-        await pop_aes(dut, expect_valid=True)
-        aes_model.pop(0)
-
-    while len(sha_model) > 0:
-        await RisingEdge(dut.clk)
-        assert int(dut.valid_out_sha.value) == 1
-        await pop_sha(dut, expect_valid=True)
-        sha_model.pop(0)
-
-    # Now both queues are empty
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 0
-    assert int(dut.valid_out_sha.value) == 0
-
-    # --- 5) Fill AES to full, check full behavior + contents ------------------
-    aes_fill_golden = []
-    for i in range(QDEPTH):
-        opc = 0b00
-        key, text, dest = i, i + 1, i + 2
-        aes_fill_golden.append(pack_instr(opc, key, text, dest))
-        await push_if_ready(dut, opc, key, text, dest, should_accept=True)
-
-    await RisingEdge(dut.clk)
-    assert int(dut.ready_out_aes.value) == 0, "AES should be full"
-    assert int(dut.valid_out_aes.value) == 1, "AES not empty when full"
+        assert await pop_checked(h.clk, h.valid_out_sha, h.instr_sha, h.ready_in_sha, sha_model[0])
+        sha_model.popleft()
+
+    # --- Clean up remaining items from section 2 ------------------------------
+    await stream_drain(h.clk, h.valid_out_aes, h.instr_aes, h.ready_in_aes, aes_model)
+    aes_model.clear()
+    await stream_drain(h.clk, h.valid_out_sha, h.instr_sha, h.ready_in_sha, sha_model)
+    sha_model.clear()
+
+    # Now both queues are empty; check the settled outputs of the last pop
+    # edge rather than spending another clock
+    await ReadOnly()
+    assert h.valid_out_aes.value.integer == 0
+    assert h.valid_out_sha.value.integer == 0
+    await NextTimeStep()
+
+    # --- 3) Fill AES to full, check full behavior + contents ------------------
+    aes_fill_golden = [pack_instr(0b00, i, i + 1, i + 2) for i in range(QDEPTH)]
+    await stream_fill(h.clk, h.instr_in, h.valid_in, aes_fill_golden)
+
+    await RisingEdge(h.clk)
+    assert h.ready_out_aes.value.integer == 0, "AES should be full"
+    assert h.valid_out_aes.value.integer == 1, "AES not empty when full"
 
     # Overflow attempt: should not be accepted
     await push_if_ready(dut, 0b00, 0xDEAD, 0xBEEF, 0xFACE, should_accept=False)
 
     # Drain AES, check data in order and pointer wrap safety
-    for expected in aes_fill_golden:
-        await RisingEdge(dut.clk)
-        assert int(dut.valid_out_aes.value) == 1
-        assert get_int(dut.instr_aes) == expected
-        await pop_aes(dut, expect_valid=True)
+    await stream_drain(h.clk, h.valid_out_aes, h.instr_aes, h.ready_in_aes, aes_fill_golden)
 
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 0
-    assert int(dut.ready_out_aes.value) == 1  # space again
-
-    # --- 6) Fill SHA to full, same checks -------------------------------------
-    sha_fill_golden = []
-    for i in range(QDEPTH):
-        opc = 0b01
-        key, text, dest = (i << 2), (i << 1), i
-        sha_fill_golden.append(pack_instr(opc, key, text, dest))
-        await push_if_ready(dut, opc, key, text, dest, should_accept=True)
+    await ReadOnly()
+    assert h.valid_out_aes.value.integer == 0
+    assert h.ready_out_aes.value.integer == 1  # space again
+    await NextTimeStep()
 
-    await RisingEdge(dut.clk)
-    assert int(dut.ready_out_sha.value) == 0, "SHA should be full"
-    assert int(dut.valid_out_sha.value) == 1, "SHA not empty when full"
+    # --- 4) Fill SHA to full, same checks -------------------------------------
+    sha_fill = [pack_instr(0b01, i << 2, i << 1, i) for i in range(QDEPTH)]
+    sha_fill_golden = [pack_sha_instr(0b01, i << 1, i) for i in range(QDEPTH)]
+    await stream_fill(h.clk, h.instr_in, h.valid_in, sha_fill)
+
+    await RisingEdge(h.clk)
+    assert h.ready_out_sha.value.integer == 0, "SHA should be full"
+    assert h.valid_out_sha.value.integer == 1, "SHA not empty when full"
 
     # Overflow attempt
     await push_if_ready(dut, 0b01, 1, 2, 3, should_accept=False)
 
     # Drain SHA, check order
-    for expected in sha_fill_golden:
-        await RisingEdge(dut.clk)
-        assert int(dut.valid_out_sha.value) == 1
-        assert get_int(dut.instr_sha) == expected
-        await pop_sha(dut, expect_valid=True)
+    await stream_drain(h.clk, h.valid_out_sha, h.instr_sha, h.ready_in_sha, sha_fill_golden)
 
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_sha.value) == 0
-    assert int(dut.ready_out_sha.value) == 1
+    await ReadOnly()
+    assert h.valid_out_sha.value.integer == 0
+    assert h.ready_out_sha.value.integer == 1
+    await NextTimeStep()
 
-    # --- 7) Empty-pop protection ----------------------------------------------
+    # --- 5) Empty-pop protection ----------------------------------------------
     await pop_aes(dut, expect_valid=False)
     await pop_sha(dut, expect_valid=False)
 
     # --- Clean state before random test --------------------------------------
     # Make absolutely sure both queues are empty
-    while int(dut.valid_out_aes.value) == 1:
-        dut.ready_in_aes.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_aes.value = 0
-        await RisingEdge(dut.clk)
-    
-    while int(dut.valid_out_sha.value) == 1:
-        dut.ready_in_sha.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_sha.value = 0
-        await RisingEdge(dut.clk)
+    await drain(h.valid_out_aes, h.ready_in_aes)
+    await drain(h.valid_out_sha, h.ready_in_sha)
     
     # Verify clean state
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 0, "AES should be empty before random test"
-    assert int(dut.valid_out_sha.value) == 0, "SHA should be empty before random test"
-    assert int(dut.ready_out_aes.value) == 1, "AES should be ready before random test"
-    assert int(dut.ready_out_sha.value) == 1, "SHA should be ready before random test"
-
-    # --- 8) Random stress with DEBUG LOGGING ----------------------------------
-    aes_sw = []
-    sha_sw = []
-
-    for iteration in range(50):  # Reduced from 100 to find failure faster
-        # Log current state
-        aes_ready = int(dut.ready_out_aes.value)
-        sha_ready = int(dut.ready_out_sha.value)
-        aes_valid = int(dut.valid_out_aes.value)
-        sha_valid = int(dut.valid_out_sha.value)
-        
-        print(f"\n[Iter {iteration}] AES: ready={aes_ready}, valid={aes_valid}, sw_len={len(aes_sw)} | SHA: ready={sha_ready}, valid={sha_valid}, sw_len={len(sha_sw)}")
-        
+    await RisingEdge(h.clk)
+    check_status(dut, 0, 0, 1, 1, when="before random test")
+
+    # --- 6) Random stress ----------------------------------------------------
+    aes_sw = deque()
+    sha_sw = deque()
+
+    # Draw every iteration's stimulus up front (from cocotb's seeded RNG, so
+    # RANDOM_SEED still reproduces a run) to keep the loop pure I/O
+    stimulus = [
+        (random.random(), random.random(), random.getrandbits(1),
+         random.getrandbits(ADDRW), random.getrandbits(ADDRW), random.getrandbits(ADDRW))
+        for _ in range(50)
+    ]
+
+    for iteration, (op_roll, pop_roll, opc, key, text, dest) in enumerate(stimulus):
         # Randomly decide: enqueue or dequeue
-        if random.random() < 0.6:
+        if op_roll < 0.6:
             # Try to enqueue
-            opc = random.choice([0b00, 0b01])
-            key  = random.randrange(1 << ADDRW)
-            text = random.randrange(1 << ADDRW)
-            dest = random.randrange(1 << ADDRW)
             is_sha = (opc & 1) == 1
-            queue_name = "SHA" if is_sha else "AES"
-            ready_now = sha_ready if is_sha else aes_ready
-            
-            print(f"  -> Attempting PUSH to {queue_name}, ready={ready_now}")
-            
-            if ready_now == 1:
+
+            if (h.ready_out_sha if is_sha else h.ready_out_aes).value.integer == 1:
                 # Direct push without using push_if_ready
-                dut.opcode.value = opc
-                dut.key_addr.value = key
-                dut.text_addr.value = text
-                dut.dest_addr.value = dest
-                dut.valid_in.value = 1
-                await RisingEdge(dut.clk)
-                dut.valid_in.value = 0
-                
-                instr = pack_instr(opc, key, text, dest)
-                (sha_sw if is_sha else aes_sw).append(instr)
-                print(f"  -> PUSHED to {queue_name}")
-            else:
-                print(f"  -> SKIPPED push to {queue_name} (not ready)")
+                h.instr_in.value = pack_instr(opc, key, text, dest)
+                h.valid_in.value = 1
+                await RisingEdge(h.clk)
+                h.valid_in.value = 0
+
+                if is_sha:
+                    sha_sw.append(pack_sha_instr(opc, text, dest))
+                else:
+                    aes_sw.append(pack_instr(opc, key, text, dest))
         else:
             # Try to dequeue
-            if random.random() < 0.5 and len(aes_sw) > 0:
-                print(f"  -> Attempting POP from AES (model has {len(aes_sw)} items)")
-                await RisingEdge(dut.clk)
-                if int(dut.valid_out_aes.value) == 1:
-                    actual = get_int(dut.instr_aes)
-                    expected = aes_sw[0]
-                    print(f"  -> Checking AES: expected={expected:x}, actual={actual:x}")
-                    assert actual == expected, f"Mismatch!"
-                    dut.ready_in_aes.value = 1
-                    await RisingEdge(dut.clk)
-                    dut.ready_in_aes.value = 0
-                    aes_sw.pop(0)
-                    print(f"  -> POPPED from AES")
-                else:
-                    print(f"  -> SKIP pop from AES (not valid)")
-            elif len(sha_sw) > 0:
-                print(f"  -> Attempting POP from SHA (model has {len(sha_sw)} items)")
-                await RisingEdge(dut.clk)
-                if int(dut.valid_out_sha.value) == 1:
-                    actual = get_int(dut.instr_sha)
-                    expected = sha_sw[0]
-                    print(f"  -> Checking SHA: expected={expected:x}, actual={actual:x}")
-                    assert actual == expected, f"Mismatch!"
-                    dut.ready_in_sha.value = 1
-                    await RisingEdge(dut.clk)
-                    dut.ready_in_sha.value = 0
-                    sha_sw.pop(0)
-                    print(f"  -> POPPED from SHA")
-                else:
-                    print(f"  -> SKIP pop from SHA (not valid)")
+            if pop_roll < 0.5 and aes_sw:
+                if await pop_checked(h.clk, h.valid_out_aes, h.instr_aes, h.ready_in_aes, aes_sw[0]):
+                    aes_sw.popleft()
+            elif sha_sw:
+                if await pop_checked(h.clk, h.valid_out_sha, h.instr_sha, h.ready_in_sha, sha_sw[0]):
+                    sha_sw.popleft()
 
     # Drain remaining
-    print(f"\n[DRAINING] AES has {len(aes_sw)} items, SHA has {len(sha_sw)} items")
-    
-    while len(aes_sw) > 0:
-        await RisingEdge(dut.clk)
-        if int(dut.valid_out_aes.value) == 1:
-            assert get_int(dut.instr_aes) == aes_sw[0]
-            dut.ready_in_aes.value = 1
-            await RisingEdge(dut.clk)
-            dut.ready_in_aes.value = 0
-            aes_sw.pop(0)
-
-    while len(sha_sw) > 0:
-        await RisingEdge(dut.clk)
-        if int(dut.valid_out_sha.value) == 1:
-            assert get_int(dut.instr_sha) == sha_sw[0]
-            dut.ready_in_sha.value = 1
-            await RisingEdge(dut.clk)
-            dut.ready_in_sha.value = 0
-            sha_sw.pop(0)
+    await stream_drain(h.clk, h.valid_out_aes, h.instr_aes, h.ready_in_aes, aes_sw)
+    aes_sw.clear()
+    await stream_drain(h.clk, h.valid_out_sha, h.instr_sha, h.ready_in_sha, sha_sw)
+    sha_sw.clear()
 
-    await RisingEdge(dut.clk)
-    assert len(aes_sw) == 0
-    assert len(sha_sw) == 0
-    assert int(dut.valid_out_aes.value) == 0
-    assert int(dut.valid_out_sha.value) == 0
-    assert int(dut.ready_out_aes.value) == 1
-    assert int(dut.ready_out_sha.value) == 1
+    await ReadOnly()
+    check_status(dut, 0, 0, 1, 1, when="after random test")
+    await NextTimeStep()
 
 
 @cocotb.test()
 async def test_simultaneous_push_pop(dut):
     """Test simultaneous push and pop operations (throughput test)."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
-    await reset(dut)
-    
-    dut._log.info("Testing simultaneous push/pop for maximum throughput")
+    h = await setup(dut)
     
     # Push one AES item first
-    dut.opcode.value = 0b00
-    dut.key_addr.value = 0x111
-    dut.text_addr.value = 0x222
-    dut.dest_addr.value = 0x333
-    dut.valid_in.value = 1
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
+    h.instr_in.value = pack_instr(0b00, 0x111, 0x222, 0x333)
+    h.valid_in.value = 1
+    await RisingEdge(h.clk)
+    h.valid_in.value = 0
     
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 1, "Should have 1 AES item"
+    await RisingEdge(h.clk)
+    assert h.valid_out_aes.value.integer == 1, "Should have 1 AES item"
     
     # Now simultaneously push new item and pop existing item
-    dut.opcode.value = 0b00
-    dut.key_addr.value = 0x444
-    dut.text_addr.value = 0x555
-    dut.dest_addr.value = 0x666
-    dut.valid_in.value = 1
-    dut.ready_in_aes.value = 1
+    h.instr_in.value = PUSH_POP_AES
+    h.valid_in.value = 1
+    h.ready_in_aes.value = 1
     
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
-    dut.ready_in_aes.value = 0
+    await RisingEdge(h.clk)
+    h.valid_in.value = 0
+    h.ready_in_aes.value = 0
     
     # Check that queue still has 1 item (popped 1, pushed 1)
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 1, "Should still have 1 item after simultaneous push/pop"
-    assert get_int(dut.instr_aes) == pack_instr(0b00, 0x444, 0x555, 0x666), "Should see the newly pushed item"
+    await RisingEdge(h.clk)
+    assert h.valid_out_aes.value.integer == 1, "Should still have 1 item after simultaneous push/pop"
+    assert get_int(h.instr_aes) == PUSH_POP_AES, "Should see the newly pushed item"
     
     # Test with SHA as well
-    dut.opcode.value = 0b01
-    dut.key_addr.value = 0x777
-    dut.text_addr.value = 0x888
-    dut.dest_addr.value = 0x999
-    dut.valid_in.value = 1
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
+    h.instr_in.value = pack_instr(0b01, 0x777, 0x888, 0x999)
+    h.valid_in.value = 1
+    await RisingEdge(h.clk)
+    h.valid_in.value = 0
     
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_sha.value) == 1
+    await RisingEdge(h.clk)
+    assert h.valid_out_sha.value.integer == 1
     
-    dut.opcode.value = 0b01
-    dut.key_addr.value = 0xAAA
-    dut.text_addr.value = 0xBBB
-    dut.dest_addr.value = 0xCCC
-    dut.valid_in.value = 1
-    dut.ready_in_sha.value = 1
+    h.instr_in.value = PUSH_POP_SHA
+    h.valid_in.value = 1
+    h.ready_in_sha.value = 1
     
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
-    dut.ready_in_sha.value = 0
+    await RisingEdge(h.clk)
+    h.valid_in.value = 0
+    h.ready_in_sha.value = 0
     
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_sha.value) == 1
-    assert get_int(dut.instr_sha) == pack_instr(0b01, 0xAAA, 0xBBB, 0xCCC)
+    await RisingEdge(h.clk)
+    assert h.valid_out_sha.value.integer == 1
+    assert get_int(h.instr_sha) == PUSH_POP_SHA_ENTRY
     
-    dut._log.info("Simultaneous push/pop test PASSED")
-
 
 @cocotb.test()
 async def test_both_queues_simultaneous(dut):
     """Test both queues operating simultaneously."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
-    await reset(dut)
-    
-    dut._log.info("Testing simultaneous operations on both queues")
+    h = await setup(dut)
     
     # Push to both AES and SHA simultaneously (Note: can only push one per cycle due to single valid_in)
     # So we push to AES first
-    dut.opcode.value = 0b00
-    dut.key_addr.value = 0x100
-    dut.text_addr.value = 0x200
-    dut.dest_addr.value = 0x300
-    dut.valid_in.value = 1
-    await RisingEdge(dut.clk)
+    h.instr_in.value = pack_instr(0b00, 0x100, 0x200, 0x300)
+    h.valid_in.value = 1
+    await RisingEdge(h.clk)
     
     # Then push to SHA
-    dut.opcode.value = 0b01
-    dut.key_addr.value = 0x400
-    dut.text_addr.value = 0x500
-    dut.dest_addr.value = 0x600
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
+    h.instr_in.value = pack_instr(0b01, 0x400, 0x500, 0x600)
+    await RisingEdge(h.clk)
+    h.valid_in.value = 0
     
     # Verify both queues have items
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 1
-    assert int(dut.valid_out_sha.value) == 1
+    await RisingEdge(h.clk)
+    assert h.valid_out_aes.value.integer == 1
+    assert h.valid_out_sha.value.integer == 1
     
     # Pop from both simultaneously
-    dut.ready_in_aes.value = 1
-    dut.ready_in_sha.value = 1
-    await RisingEdge(dut.clk)
-    dut.ready_in_aes.value = 0
-    dut.ready_in_sha.value = 0
+    h.ready_in_aes.value = 1
+    h.ready_in_sha.value = 1
+    await RisingEdge(h.clk)
+    h.ready_in_aes.value = 0
+    h.ready_in_sha.value = 0
     
     # Both queues should be empty now
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 0
-    assert int(dut.valid_out_sha.value) == 0
+    await RisingEdge(h.clk)
+    assert h.valid_out_aes.value.integer == 0
+    assert h.valid_out_sha.value.integer == 0
     
     # Test push to one while popping from other
     # Add 2 items to each queue
+    aes_instr = instr_value(pack_instr(0b00, 0x111, 0x222, 0x333))
+    sha_instr = instr_value(pack_instr(0b01, 0x444, 0x555, 0x666))
+    h.valid_in.value = 1
     for _ in range(2):
-        dut.opcode.value = 0b00
-        dut.key_addr.value = 0x111
-        dut.text_addr.value = 0x222
-        dut.dest_addr.value = 0x333
-        dut.valid_in.value = 1
-        await RisingEdge(dut.clk)
+        h.instr_in.value = aes_instr
+        await RisingEdge(h.clk)
         
-        dut.opcode.value = 0b01
-        dut.key_addr.value = 0x444
-        dut.text_addr.value = 0x555
-        dut.dest_addr.value = 0x666
-        await RisingEdge(dut.clk)
+        h.instr_in.value = sha_instr
+        await RisingEdge(h.clk)
     
-    dut.valid_in.value = 0
-    await RisingEdge(dut.clk)
+    h.valid_in.value = 0
+    await RisingEdge(h.clk)
     
     # Now push to AES while popping from SHA
-    dut.opcode.value = 0b00
-    dut.key_addr.value = 0x777
-    dut.text_addr.value = 0x888
-    dut.dest_addr.value = 0x999
-    dut.valid_in.value = 1
-    dut.ready_in_sha.value = 1
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
-    dut.ready_in_sha.value = 0
-    
-    await RisingEdge(dut.clk)
+    h.instr_in.value = pack_instr(0b00, 0x777, 0x888, 0x999)
+    h.valid_in.value = 1
+    h.ready_in_sha.value = 1
+    await RisingEdge(h.clk)
+    h.valid_in.value = 0
+    h.ready_in_sha.value = 0
+    
+    await RisingEdge(h.clk)
     # AES should have 3 items, SHA should have 1 item
-    assert int(dut.valid_out_aes.value) == 1
-    assert int(dut.valid_out_sha.value) == 1
+    assert h.valid_out_aes.value.integer == 1
+    assert h.valid_out_sha.value.integer == 1
     
-    dut._log.info("Simultaneous dual-queue operations test PASSED")
-
 
 @cocotb.test()
 async def test_wraparound_stress(dut):
     """Stress test pointer wraparound in circular buffer."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
-    await reset(dut)
-    
-    dut._log.info("Testing circular buffer wraparound stress")
-    
-    model = []
+    h = await setup(dut)
+    
+    # Every push of every cycle, in order: a full fill of QDEPTH entries, then
+    # a refill of 10, with bases matching the per-cycle counters. The queue is
+    # FIFO, so pops consume the same list from a head index and pushes advance
+    # a tail index
+    golden = [
+        pack_instr(0b00, base + i, base + i + 1, base + i + 2)
+        for cycle in range(5)
+        for base, count in ((cycle * QDEPTH, QDEPTH), (cycle * QDEPTH + QDEPTH, 10))
+        for i in range(count)
+    ]
+    head = tail = 0
     
     # Perform multiple fill/drain cycles to force wraparound
     for cycle in range(5):
-        dut._log.info(f"Wraparound cycle {cycle + 1}/5")
+        dut._log.info("Wraparound cycle %d/5", cycle + 1)
         
         # Fill to capacity
-        for i in range(QDEPTH):
-            val = cycle * QDEPTH + i
-            dut.opcode.value = 0b00
-            dut.key_addr.value = val
-            dut.text_addr.value = val + 1
-            dut.dest_addr.value = val + 2
-            dut.valid_in.value = 1
-            model.append(pack_instr(0b00, val, val + 1, val + 2))
-            await RisingEdge(dut.clk)
-        
-        dut.valid_in.value = 0
-        await RisingEdge(dut.clk)
-        assert int(dut.ready_out_aes.value) == 0, "Queue should be full"
+        await stream_fill(h.clk, h.instr_in, h.valid_in, golden[tail:tail + QDEPTH])
+        tail += QDEPTH
+        await RisingEdge(h.clk)
+        assert h.ready_out_aes.value.integer == 0, "Queue should be full"
         
         # Drain 10 items (partial drain to create wraparound scenario)
-        for _ in range(10):
-            await RisingEdge(dut.clk)
-            assert int(dut.valid_out_aes.value) == 1
-            assert get_int(dut.instr_aes) == model[0], "Data mismatch during wraparound"
-            model.pop(0)
-            dut.ready_in_aes.value = 1
-            await RisingEdge(dut.clk)
-            dut.ready_in_aes.value = 0
+        await stream_drain(
+            h.clk, h.valid_out_aes, h.instr_aes, h.ready_in_aes,
+            golden[head:head + 10],
+        )
+        head += 10
         
         # Queue should have 6 items remaining
-        await RisingEdge(dut.clk)
-        assert int(dut.ready_out_aes.value) == 1, "Queue should have space after partial drain"
+        await ReadOnly()
+        assert h.ready_out_aes.value.integer == 1, "Queue should have space after partial drain"
+        await NextTimeStep()
         
         # Add 10 more items (this will force writeIdx to wrap)
-        for i in range(10):
-            val = (cycle * QDEPTH + QDEPTH + i)
-            dut.opcode.value = 0b00
-            dut.key_addr.value = val
-            dut.text_addr.value = val + 1
-            dut.dest_addr.value = val + 2
-            dut.valid_in.value = 1
-            model.append(pack_instr(0b00, val, val + 1, val + 2))
-            await RisingEdge(dut.clk)
-        
-        dut.valid_in.value = 0
+        await stream_fill(h.clk, h.instr_in, h.valid_in, golden[tail:tail + 10])
+        tail += 10
         
         # Now queue should be full again (6 + 10 = 16)
-        await RisingEdge(dut.clk)
-        assert int(dut.ready_out_aes.value) == 0, "Queue should be full after refill"
+        await RisingEdge(h.clk)
+        assert h.ready_out_aes.value.integer == 0, "Queue should be full after refill"
         
         # Drain all remaining items and verify order
-        while len(model) > 0:
-            await RisingEdge(dut.clk)
-            assert int(dut.valid_out_aes.value) == 1
-            assert get_int(dut.instr_aes) == model[0], f"Data mismatch in cycle {cycle}"
-            model.pop(0)
-            dut.ready_in_aes.value = 1
-            await RisingEdge(dut.clk)
-            dut.ready_in_aes.value = 0
+        await stream_drain(h.clk, h.valid_out_aes, h.instr_aes, h.ready_in_aes, golden[head:tail])
+        head = tail
         
-        await RisingEdge(dut.clk)
-        assert int(dut.valid_out_aes.value) == 0, "Queue should be empty"
+        await ReadOnly()
+        assert h.valid_out_aes.value.integer == 0, "Queue should be empty"
+        await NextTimeStep()
     
-    dut._log.info("Wraparound stress test PASSED")
-
 
 @cocotb.test()
 async def test_reset_during_operation(dut):
     """Test reset behavior during active operation."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
-    await reset(dut)
+    h = await setup(dut)
     
-    dut._log.info("Testing reset during operation")
-    
-    # Fill queue halfway with AES items
-    for i in range(8):
-        dut.opcode.value = 0b00
-        dut.key_addr.value = i
-        dut.text_addr.value = i + 100
-        dut.dest_addr.value = i + 200
-        dut.valid_in.value = 1
-        await RisingEdge(dut.clk)
-    
-    # Fill queue halfway with SHA items
-    for i in range(8):
-        dut.opcode.value = 0b01
-        dut.key_addr.value = i + 1000
-        dut.text_addr.value = i + 1100
-        dut.dest_addr.value = i + 1200
-        await RisingEdge(dut.clk)
-    
-    dut.valid_in.value = 0
-    await RisingEdge(dut.clk)
+    # Fill both queues halfway, AES items first then SHA items
+    await stream_fill(
+        h.clk, h.instr_in, h.valid_in,
+        [pack_instr(0b00, i, i + 100, i + 200) for i in range(8)]
+        + [pack_instr(0b01, i + 1000, i + 1100, i + 1200) for i in range(8)],
+    )
+    await RisingEdge(h.clk)
     
     # Verify queues have items
-    assert int(dut.valid_out_aes.value) == 1
-    assert int(dut.valid_out_sha.value) == 1
+    assert h.valid_out_aes.value.integer == 1
+    assert h.valid_out_sha.value.integer == 1
     
     # Assert reset
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 3)
+    h.rst_n.value = 0
+    await ClockCycles(h.clk, 3)
     
     # During reset, outputs should be 0
-    assert int(dut.valid_out_aes.value) == 0
-    assert int(dut.valid_out_sha.value) == 0
-    assert int(dut.ready_out_aes.value) == 0
-    assert int(dut.ready_out_sha.value) == 0
+    check_status(dut, 0, 0, 0, 0, when="during reset")
     
     # Deassert reset
-    dut.rst_n.value = 1
-    await ClockCycles(dut.clk, 2)
+    h.rst_n.value = 1
+    await ClockCycles(h.clk, 2)
     
     # After reset, queues should be empty and ready
-    assert int(dut.valid_out_aes.value) == 0
-    assert int(dut.valid_out_sha.value) == 0
-    assert int(dut.ready_out_aes.value) == 1
-    assert int(dut.ready_out_sha.value) == 1
+    check_status(dut, 0, 0, 1, 1, when="after reset")
     
     # Verify normal operation after reset
-    dut.opcode.value = 0b00
-    dut.key_addr.value = 0xABC
-    dut.text_addr.value = 0xDEF
-    dut.dest_addr.value = 0x123
-    dut.valid_in.value = 1
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
+    h.instr_in.value = POST_RESET_AES
+    h.valid_in.value = 1
+    await RisingEdge(h.clk)
+    h.valid_in.value = 0
     
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 1
-    assert get_int(dut.instr_aes) == pack_instr(0b00, 0xABC, 0xDEF, 0x123)
+    await RisingEdge(h.clk)
+    assert h.valid_out_aes.value.integer == 1
+    assert get_int(h.instr_aes) == POST_RESET_AES
     
-    dut._log.info("Reset during operation test PASSED")
-
 
 @cocotb.test()
 async def test_multi_cycle_valid_in(dut):
     """Test behavior when valid_in stays high for multiple cycles."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
-    await reset(dut)
-    
-    dut._log.info("Testing multi-cycle valid_in behavior")
+    h = await setup(dut)
     
     # Set up an instruction
-    dut.opcode.value = 0b00
-    dut.key_addr.value = 0x123
-    dut.text_addr.value = 0x456
-    dut.dest_addr.value = 0x789
+    h.instr_in.value = pack_instr(0b00, 0x123, 0x456, 0x789)
     
     # Hold valid_in high for 3 cycles
-    dut.valid_in.value = 1
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
+    h.valid_in.value = 1
+    await ClockCycles(h.clk, 3)
+    h.valid_in.value = 0
     
-    await RisingEdge(dut.clk)
+    await RisingEdge(h.clk)
     
     # Check how many items were enqueued
     # NOTE: Current implementation will enqueue 3 times (potential bug)
     # This test documents the behavior
     item_count = 0
-    while int(dut.valid_out_aes.value) == 1:
+    while h.valid_out_aes.value.integer == 1:
         item_count += 1
-        dut.ready_in_aes.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_aes.value = 0
-        await RisingEdge(dut.clk)
+        h.ready_in_aes.value = 1
+        await RisingEdge(h.clk)
+        h.ready_in_aes.value = 0
+        await RisingEdge(h.clk)
     
-    dut._log.info(f"Multi-cycle valid_in enqueued {item_count} items")
+    dut._log.info("Multi-cycle valid_in enqueued %d items", item_count)
     # With current implementation, this will be 3
     # Ideal behavior might be 1 (edge-triggered)
     
-    dut._log.info("Multi-cycle valid_in test completed (behavior documented)")
-
 
 @cocotb.test()
 async def test_full_queue_persistent_valid(dut):
     """Test that full queue properly rejects with persistent valid_in."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
-    await reset(dut)
-    
-    dut._log.info("Testing full queue with persistent valid_in")
+    h = await setup(dut)
     
-    # Fill queue to capacity
-    for i in range(QDEPTH):
-        dut.opcode.value = 0b00
-        dut.key_addr.value = i
-        dut.text_addr.value = i + 1
-        dut.dest_addr.value = i + 2
-        dut.valid_in.value = 1
-        await RisingEdge(dut.clk)
-    
-    # Queue is now full
-    await RisingEdge(dut.clk)
-    assert int(dut.ready_out_aes.value) == 0, "Queue should be full"
+    golden = [pack_instr(0b00, i, i + 1, i + 2) for i in range(QDEPTH)]
+
+    # Fill queue to capacity; ready_out_aes drops on the edge that stores the
+    # last entry, so wait for that instead of counting one more cycle
+    h.valid_in.value = 1
+    for instr in golden[:-1]:
+        h.instr_in.value = instr
+        await RisingEdge(h.clk)
+    h.instr_in.value = golden[-1]
+    await with_timeout(FallingEdge(h.ready_out_aes), 20, "ns")
+    assert h.ready_out_aes.value.integer == 0, "Queue should be full"
     
     # Keep trying to push with valid_in high
-    dut.opcode.value = 0b00
-    dut.key_addr.value = 0xBAD
-    dut.text_addr.value = 0xBAD
-    dut.dest_addr.value = 0xBAD
-    dut.valid_in.value = 1
+    h.instr_in.value = pack_instr(0b00, 0xBAD, 0xBAD, 0xBAD)
+    h.valid_in.value = 1
     
-    # Hold valid_in for several cycles
+    # Hold valid_in for several cycles, observing ready_out on each edge so a
+    # glitch in the window is caught; the drain below catches a rejected push
+    # that slipped in anyway
     for _ in range(5):
-        await RisingEdge(dut.clk)
-        assert int(dut.ready_out_aes.value) == 0, "ready_out should stay 0 when full"
+        await RisingEdge(h.clk)
+        assert h.ready_out_aes.value.integer == 0, "ready_out should stay 0 when full"
     
-    dut.valid_in.value = 0
+    h.valid_in.value = 0
     
     # Drain queue and verify the bad value wasn't inserted
-    for i in range(QDEPTH):
-        await RisingEdge(dut.clk)
-        expected = pack_instr(0b00, i, i + 1, i + 2)
-        actual = get_int(dut.instr_aes)
-        assert actual == expected, f"Bad data found! Expected {expected:x}, got {actual:x}"
-        dut.ready_in_aes.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_aes.value = 0
+    await stream_drain(h.clk, h.valid_out_aes, h.instr_aes, h.ready_in_aes, golden)
     
-    await RisingEdge(dut.clk)
-    assert int(dut.valid_out_aes.value) == 0, "Queue should be empty"
+    await ReadOnly()
+    assert h.valid_out_aes.value.integer == 0, "Queue should be empty"
+    await NextTimeStep()
     
-    dut._log.info("Full queue with persistent valid_in test PASSED")
-
 
 @cocotb.test()
 async def test_almost_full_boundary(dut):
     """Test operations at almost-full boundary."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
-    await reset(dut)
-    
-    dut._log.info("Testing almost-full boundary conditions")
+    h = await setup(dut)
     
     # Fill to 15/16 (one slot remaining)
-    for i in range(QDEPTH - 1):
-        dut.opcode.value = 0b00
-        dut.key_addr.value = i
-        dut.text_addr.value = i + 100
-        dut.dest_addr.value = i + 200
-        dut.valid_in.value = 1
-        await RisingEdge(dut.clk)
-    
-    dut.valid_in.value = 0
-    await RisingEdge(dut.clk)
+    await stream_fill(
+        h.clk, h.instr_in, h.valid_in,
+        [pack_instr(0b00, i, i + 100, i + 200) for i in range(QDEPTH - 1)],
+    )
+    await RisingEdge(h.clk)
     
     # Should still be ready (not full)
-    assert int(dut.ready_out_aes.value) == 1, "Queue should not be full at 15/16"
+    assert h.ready_out_aes.value.integer == 1, "Queue should not be full at 15/16"
     
     # Perform the boundary dance: push-full, pop-almost-full, push-full
+    fill_instr = instr_value(pack_instr(0b00, 0xFFF, 0xFFF, 0xFFF))
     for dance in range(10):
         # Push one more to make it full
-        dut.opcode.value = 0b00
-        dut.key_addr.value = 0xFFF
-        dut.text_addr.value = 0xFFF
-        dut.dest_addr.value = 0xFFF
-        dut.valid_in.value = 1
-        await RisingEdge(dut.clk)
-        dut.valid_in.value = 0
+        h.instr_in.value = fill_instr
+        h.valid_in.value = 1
+        await RisingEdge(h.clk)
+        h.valid_in.value = 0
         
-        await RisingEdge(dut.clk)
-        assert int(dut.ready_out_aes.value) == 0, f"Should be full in dance {dance}"
+        await RisingEdge(h.clk)
+        assert h.ready_out_aes.value.integer == 0, f"Should be full in dance {dance}"
         
         # Pop one
-        dut.ready_in_aes.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_aes.value = 0
+        h.ready_in_aes.value = 1
+        await RisingEdge(h.clk)
+        h.ready_in_aes.value = 0
         
-        await RisingEdge(dut.clk)
-        assert int(dut.ready_out_aes.value) == 1, f"Should have space in dance {dance}"
-    
-    # Drain remaining
-    while int(dut.valid_out_aes.value) == 1:
-        dut.ready_in_aes.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_aes.value = 0
-        await RisingEdge(dut.clk)
+        await RisingEdge(h.clk)
+        assert h.ready_out_aes.value.integer == 1, f"Should have space in dance {dance}"
     
-    dut._log.info("Almost-full boundary test PASSED")
-
 
 @cocotb.test()
 async def test_undefined_opcodes(dut):
     """Test behavior with undefined opcodes 0b10 and 0b11."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
-    await reset(dut)
-    
-    dut._log.info("Testing undefined opcodes")
+    h = await setup(dut)
     
     # Test opcode 0b10 (should go to AES based on opcode[0] == 0)
-    dut.opcode.value = 0b10
-    dut.key_addr.value = 0x100
-    dut.text_addr.value = 0x200
-    dut.dest_addr.value = 0x300
-    dut.valid_in.value = 1
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
+    h.instr_in.value = UNDEF_OPC_10
+    h.valid_in.value = 1
+    await RisingEdge(h.clk)
+    h.valid_in.value = 0
     
-    await RisingEdge(dut.clk)
-    if int(dut.valid_out_aes.value) == 1:
+    await RisingEdge(h.clk)
+    if h.valid_out_aes.value.integer == 1:
         dut._log.info("Opcode 0b10 went to AES queue")
-        assert get_int(dut.instr_aes) == pack_instr(0b10, 0x100, 0x200, 0x300)
-        dut.ready_in_aes.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_aes.value = 0
-    elif int(dut.valid_out_sha.value) == 1:
+        assert get_int(h.instr_aes) == UNDEF_OPC_10
+        h.ready_in_aes.value = 1
+        await RisingEdge(h.clk)
+        h.ready_in_aes.value = 0
+    elif h.valid_out_sha.value.integer == 1:
         dut._log.info("Opcode 0b10 went to SHA queue")
-        dut.ready_in_sha.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_sha.value = 0
+        h.ready_in_sha.value = 1
+        await RisingEdge(h.clk)
+        h.ready_in_sha.value = 0
     
     # Test opcode 0b11 (should go to SHA based on opcode[0] == 1)
-    dut.opcode.value = 0b11
-    dut.key_addr.value = 0x400
-    dut.text_addr.value = 0x500
-    dut.dest_addr.value = 0x600
-    dut.valid_in.value = 1
-    await RisingEdge(dut.clk)
-    dut.valid_in.value = 0
+    h.instr_in.value = UNDEF_OPC_11
+    h.valid_in.value = 1
+    await RisingEdge(h.clk)
+    h.valid_in.value = 0
     
-    await RisingEdge(dut.clk)
-    if int(dut.valid_out_sha.value) == 1:
+    await RisingEdge(h.clk)
+    if h.valid_out_sha.value.integer == 1:
         dut._log.info("Opcode 0b11 went to SHA queue")
-        assert get_int(dut.instr_sha) == pack_instr(0b11, 0x400, 0x500, 0x600)
-        dut.ready_in_sha.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_sha.value = 0
-    elif int(dut.valid_out_aes.value) == 1:
+        assert get_int(h.instr_sha) == UNDEF_OPC_11_ENTRY
+        h.ready_in_sha.value = 1
+        await RisingEdge(h.clk)
+        h.ready_in_sha.value = 0
+    elif h.valid_out_aes.value.integer == 1:
         dut._log.info("Opcode 0b11 went to AES queue")
-        dut.ready_in_aes.value = 1
-        await RisingEdge(dut.clk)
-        dut.ready_in_aes.value = 0
-    
-    dut._log.info("Undefined opcode test completed (behavior documented)")
\ No newline at end of file
+        h.ready_in_aes.value = 1
+        await RisingEdge(h.clk)
+        h.ready_in_aes.value = 0
@@ -15,10 +15,10 @@ module tb ();
   localparam integer VALIDW     = 1;
   localparam integer ADDRW_TB   = 24;
   // Wire up the inputs and outputs:
-  wire clk;
+  reg clk;
   wire rst_n;
   wire n_cs;
-  wire spi_clk;
+  reg spi_clk;
   wire valid_in;
 
   // wire [VALIDW-1:0] valid;
@@ -29,7 +29,7 @@ module tb ();
   reg err;
 
   // Replace tt_um_example with your module name:
-  serializer #(.ADDRW(ADDRW_TB), .VALIDW(VALIDW)) serializerDUT  (
+  serializer #(.ADDRW(ADDRW_TB)) serializerDUT  (
       .clk(clk),
       .rst_n(rst_n),
       .n_cs(n_cs),
@@ -41,5 +41,17 @@ module tb ();
       .err(err)
   );
 
+  // Clock generation (clk 1us period = 1MHz, spi_clk 10us period = 100kHz),
+  // kept in HDL so no Python coroutine has to toggle either clock through the
+  // VPI on every edge. Both start high, like cocotb's Clock did.
+  initial begin
+    clk = 1'b1;
+    forever #500 clk = ~clk;
+  end
+
+  initial begin
+    spi_clk = 1'b1;
+    forever #5000 spi_clk = ~spi_clk;
+  end
 
 endmodule
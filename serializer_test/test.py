@@ -2,13 +2,13 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import cocotb
-from cocotb.clock import Clock
 
 from cocotb.triggers import (
+    ClockCycles,
     RisingEdge,
     ReadOnly,
     FallingEdge,
-    ReadWrite,
+    NextTimeStep,
     Timer,
     with_timeout,
 )
@@ -22,10 +22,6 @@ except ImportError:
     from cocotb.result import SimTimeoutError
 import random
 
-def bitList(value: int, width: int):
-    """Return a list of bits [MSB..LSB]."""
-    return [ (value >> i) & 1 for i in range(width-1, -1, -1) ]
-
 async def reset(dut, cycles=2):
     """Active-low rst_n."""
     dut.rst_n.value = 0
@@ -33,45 +29,59 @@ async def reset(dut, cycles=2):
     dut.valid_in.value = 0
     dut.addr.value = 0
     dut.n_cs.value = 1
-    for _ in range(cycles):
-        await RisingEdge(dut.clk)
+    await ClockCycles(dut.clk, cycles)
     dut.rst_n.value = 1
     await RisingEdge(dut.clk)
     await ReadOnly()
-    await Timer(1, "ps")      # <<< advance time; now safe to drive afterwards
-    await ReadWrite()
+    await NextTimeStep()      # <<< leave the read-only phase; now safe to drive afterwards
 
 async def shift_and_capture(dut, width):
-    out_bits = []
+    """Capture width bits of miso, MSB first, into an int."""
+    clk, spi_clk, miso = dut.clk, dut.spi_clk, dut.miso
+    out_bits = 0
     for _ in range(width):
-        await FallingEdge(dut.spi_clk) 
-        await RisingEdge(dut.clk)
-        await ReadOnly() 
-        await Timer(1, "ps")      # <<< advance time; now safe to drive afterwards
-        await ReadWrite()
-        out_bits.append(int(dut.miso.value))
+        await FallingEdge(spi_clk) 
+        await RisingEdge(clk)
+        await ReadOnly()          # miso has settled after the shifting clk edge
+        out_bits = (out_bits << 1) | int(miso.value)
+    # Nothing is driven between bits, so only leave the read-only phase once
+    await NextTimeStep()      # <<< now safe to drive afterwards
     return out_bits
 
-async def forced_error(dut, ADDRW, SHIFT_W, addr): #Force an error by randomly raising n_cs within 1-10 clock cycles of pulling ncs low
+async def wait_ready(dut, level, sync=None, timeout_us=500):
+    """
+    Wait until ready_out == level.
+    Sleeps on the ready_out edge instead of polling it every clock. The old
+    poll sampled ready_out before each clk edge updated it, so it only exited
+    on the clk edge after the change; step one more clk to keep that timing.
+    Pass sync to continue on its next rising edge instead, for the polls
+    that stepped on spi_clk.
+    Fails after timeout_us (two full 25-bit frames of spi_clk) so a stuck DUT
+    ends the test instead of hanging the regression.
+    """
+    ready_out = dut.ready_out
+    if int(ready_out.value) != level:
+        edge = (RisingEdge if level else FallingEdge)(ready_out)
+        try:
+            await with_timeout(edge, timeout_us, "us")
+        except SimTimeoutError:
+            raise AssertionError(f"ready_out never went to {level} within {timeout_us} us")
+        await RisingEdge(dut.clk if sync is None else sync)
 
-    errorclk = random.randint(1, 10)
-    errorcnt = 0
+async def forced_error(dut, ADDRW, SHIFT_W, addr): #Force an error by randomly raising n_cs within 1-10 clock cycles of pulling ncs low
 
-    while int(dut.ready_out.value) == 0:
-        await RisingEdge(dut.clk)
+    await wait_ready(dut, 1)
 
     # Load
     dut.n_cs.value     = 0
     dut.addr.value     = addr
     dut.valid_in.value = 1
 
-    while int(dut.ready_out.value) == 1:
-        await RisingEdge(dut.spi_clk)
+    await wait_ready(dut, 0, sync=dut.spi_clk)
     dut.valid_in.value = 0
 
     # random.randint(1, 10)
-    for _ in range(17):
-        await RisingEdge(dut.spi_clk)
+    await ClockCycles(dut.spi_clk, 17)
     dut.n_cs.value = 1
 
     # err should pulse for exactly 1 normal clock
@@ -80,33 +90,17 @@ async def forced_error(dut, ADDRW, SHIFT_W, addr): #Force an error by randomly r
     except SimTimeoutError:
         raise AssertionError("ERR never asserted after forced abort (raise n_cs during busy)")
     
-    # print(f"DUT error value: {dut.err.value}")
-    await RisingEdge(dut.clk) 
-    # print(f"DUT error value: {dut.err.value}")
-    await RisingEdge(dut.clk)
-    # print(f"DUT error value: {dut.err.value}")
-    assert int(dut.err.value) == 0, "ERR did not clear after a pulse"
-
-    """
-    it is in fact two rising edges you have to wait. This is what it normally looks like with at each clock edge. It does work.
-
-    DUT error value: 0
-    DUT error value: 0
-    DUT error value: 0
-    DUT error value: 1
-    DUT error value: 0
-    DUT error value: 0
-    DUT error value: 0
-    DUT error value: 0
-    
-    """
+    # ... so it must clear on the next clk edge (1 us); wake on the falling
+    # edge itself rather than stepping the clock and sampling err
+    try:
+        await with_timeout(FallingEdge(dut.err), 1500, "ns")
+    except SimTimeoutError:
+        raise AssertionError("ERR did not clear after a pulse")
 
-    while int(dut.ready_out.value) == 0:
-        await RisingEdge(dut.spi_clk)
+    await wait_ready(dut, 1, sync=dut.spi_clk)
 
 async def send_data(dut, ADDRW, SHIFT_W, addr):
-    while int(dut.ready_out.value) == 0:
-        await RisingEdge(dut.clk)
+    await wait_ready(dut, 1)
 
     # Load
     dut.n_cs.value     = 0
@@ -114,39 +108,31 @@ async def send_data(dut, ADDRW, SHIFT_W, addr):
     dut.valid_in.value = 1
 
     # Must be busy during shifting
-    while int(dut.ready_out.value) == 1:
-        await RisingEdge(dut.clk)
+    await wait_ready(dut, 0)
     dut.valid_in.value = 0
     
     # Check stream
-    word     = (1 << ADDRW) | addr
-    expected = bitList(word, SHIFT_W)
+    expected = (1 << ADDRW) | addr
     got      = await shift_and_capture(dut, SHIFT_W)
 
-    while int(dut.ready_out.value) == 0:
-        await RisingEdge(dut.clk)
+    await wait_ready(dut, 1)
     dut.n_cs.value = 1  
 
-    print (f"Got: {got}, Expected: {expected}")
-    assert got == expected, f"Frame mismatch exp={expected} got={got}"
+    dut._log.debug("Got: %x, Expected: %x", got, expected)
+    assert got == expected, f"Frame mismatch exp={expected:0{SHIFT_W}b} got={got:0{SHIFT_W}b}"
 
 async def glitch_ncs(dut): #just flick it on and off and see if ncs incorrectly enters low.
     dut.n_cs.value = 1
-    await Timer(0.4, "us")
+    await Timer(400, "ns")
     dut.n_cs.value = 0
 
 @cocotb.test()
 async def test_project(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (1000 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    #Slower SPI clocks (100 KHz), you could even randomize this...
-    spiclk = Clock(dut.spi_clk, 10, units="us") 
-
-    cocotb.start_soon(clock.start())
-    cocotb.start_soon(spiclk.start())
+    # clk (1 MHz) and the slower spi_clk (100 kHz) are generated in tb.v
 
+    clk     = dut.clk
     ADDRW   = len(dut.addr)
     VALIDW = 1
     SHIFT_W = ADDRW + VALIDW
@@ -157,24 +143,33 @@ async def test_project(dut):
     #TEST CONFIGS==========
     numberCycles = 30 #Test how many times
     #=======================
+    # Draw every iteration's stimulus up front (from cocotb's seeded RNG, so
+    # RANDOM_SEED still reproduces a run); the idle-branch lengths are drawn
+    # for every iteration and only used when that branch is taken
+    stimulus = []
     for _ in range(numberCycles):
-        addr = (random.randrange(1 << ADDRW))
-        what_happens = random.randint(0,9)
+        addr = random.randrange(1 << ADDRW)
+        what_happens = random.randint(0, 9)
+        idle = random.randint(2, 10)
+        stimulus.append((addr, what_happens, idle, random.randint(2, idle)))
 
+    for addr, what_happens, idle, test_ncs in stimulus:
         if what_happens < 6:    #send data
-            print("Checking normal execution")
+            dut._log.debug("Checking normal execution")
             await send_data(dut, ADDRW, SHIFT_W, addr)
         elif (what_happens >= 6 and(what_happens % 2 == 0)): #force error
-            print("Checking errored execution")
+            dut._log.debug("Checking errored execution")
             await forced_error(dut, ADDRW, SHIFT_W, addr)
         else:   #Sit 2-10 clock cycles and do nothing. Also test gitching by fiddling with ncs and seeing if anything loads.
-            print("Do nothing")
-            max = random.randint(2,10)
-            test_ncs = random.randint(2, max)
-            for i in range(max):
-                await RisingEdge(dut.clk)
-                if i == test_ncs:
-                    await glitch_ncs(dut)
+            dut._log.debug("Do nothing")
+            # Glitch after edge test_ncs (counting from 0); test_ncs can be
+            # past the last edge, in which case the window stays clean
+            if test_ncs < idle:
+                await ClockCycles(clk, test_ncs + 1)
+                await glitch_ncs(dut)
+                await ClockCycles(clk, idle - test_ncs - 1)
+            else:
+                await ClockCycles(clk, idle)
 
             
 
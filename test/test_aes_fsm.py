@@ -4,10 +4,11 @@ Tests FSM state transitions, request/completion queues, and bus arbiter interact
 """
 
 import cocotb
-from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge, ClockCycles, Timer
-from cocotb.types import LogicArray
-import random
+from cocotb.result import SimTimeoutError
+from cocotb.triggers import RisingEdge, ClockCycles, Edge, Timer, with_timeout
+
+
+CLK_PERIOD_NS = 10  # clk period generated by aes_fsm_tb.v
 
 
 class AESFSMDriver:
@@ -15,21 +16,33 @@ class AESFSMDriver:
     
     def __init__(self, dut):
         self.dut = dut
+        # Resolve each handle once instead of on every access
+        self._clk = dut.clk
+        self._rst_n = dut.rst_n
+        self._req_valid = dut.req_valid
+        self._req_data = dut.req_data
+        self._compq_ready_in = dut.compq_ready_in
+        self._arb_req = dut.arb_req
+        self._arb_grant = dut.arb_grant
+        self._ack_in = dut.ack_in
         self.ADDRW = 24
         self.ACCEL_ID = 0b10
         self.MEM_ID = 0b00
         
     async def reset(self):
         """Perform reset sequence"""
-        self.dut.rst_n.value = 0
-        self.dut.req_valid.value = 0
-        self.dut.req_data.value = 0
-        self.dut.compq_ready_in.value = 1
-        self.dut.arb_grant.value = 0
-        self.dut.ack_in.value = 0
-        await ClockCycles(self.dut.clk, 5)
-        self.dut.rst_n.value = 1
-        await ClockCycles(self.dut.clk, 2)
+        self._rst_n.value = 0
+        self._req_valid.value = 0
+        self._req_data.value = 0
+        self._compq_ready_in.value = 1
+        self._arb_grant.value = 0
+        self._ack_in.value = 0
+        # rst_n is asynchronous, so hold it for a plain 5-cycle timer and only
+        # sync to clk for the release
+        await Timer(5 * CLK_PERIOD_NS, "ns")
+        await RisingEdge(self._clk)
+        self._rst_n.value = 1
+        await ClockCycles(self._clk, 2)
         
     def pack_request(self, key_addr, text_addr, result_addr, hash_mode=0):
         """Pack addresses into req_data format [3*ADDRW+1:0]"""
@@ -40,43 +53,47 @@ class AESFSMDriver:
     async def send_request(self, key_addr, text_addr, result_addr, hash_mode=0):
         """Send a request to the FSM"""
         req_data = self.pack_request(key_addr, text_addr, result_addr, hash_mode)
-        self.dut.req_data.value = req_data
-        self.dut.req_valid.value = 1
-        await RisingEdge(self.dut.clk)
+        self._req_data.value = req_data
+        self._req_valid.value = 1
+        await RisingEdge(self._clk)
         # Wait for FSM to acknowledge (when it leaves READY state or loads data)
-        await RisingEdge(self.dut.clk)
+        await RisingEdge(self._clk)
         # Clear req_valid so FSM can complete and return to READY
-        self.dut.req_valid.value = 0
+        self._req_valid.value = 0
         
     async def clear_request(self):
         """Clear request valid signal"""
-        self.dut.req_valid.value = 0
-        await RisingEdge(self.dut.clk)
+        self._req_valid.value = 0
+        await RisingEdge(self._clk)
         
     async def grant_bus(self):
         """Grant bus access when arbiter request is asserted"""
-        while self.dut.arb_req.value == 0:
-            await RisingEdge(self.dut.clk)
-        self.dut.arb_grant.value = 1
-        await RisingEdge(self.dut.clk)
-        self.dut.arb_grant.value = 0
+        # Sleep until arb_req rises instead of polling it every clock, then
+        # take the next clk edge: the old poll could only see the rise there,
+        # so the grant keeps its timing
+        if self._arb_req.value == 0:
+            await RisingEdge(self._arb_req)
+            await RisingEdge(self._clk)
+        self._arb_grant.value = 1
+        await RisingEdge(self._clk)
+        self._arb_grant.value = 0
         
     async def send_mem_ack(self):
         """Send ACK from memory (ack_in = {1'b1, MEM_ID})"""
-        self.dut.ack_in.value = (1 << 2) | self.MEM_ID
-        await RisingEdge(self.dut.clk)
-        self.dut.ack_in.value = 0
+        self._ack_in.value = (1 << 2) | self.MEM_ID
+        await RisingEdge(self._clk)
+        self._ack_in.value = 0
         
     async def send_accel_ack(self):
         """Send ACK from accelerator (ack_in = {1'b1, ACCEL_ID})"""
-        self.dut.ack_in.value = (1 << 2) | self.ACCEL_ID
-        await RisingEdge(self.dut.clk)
-        self.dut.ack_in.value = 0
+        self._ack_in.value = (1 << 2) | self.ACCEL_ID
+        await RisingEdge(self._clk)
+        self._ack_in.value = 0
         
     async def set_compq_ready(self, ready):
         """Set completion queue ready signal"""
-        self.dut.compq_ready_in.value = ready
-        await RisingEdge(self.dut.clk)
+        self._compq_ready_in.value = ready
+        await RisingEdge(self._clk)
 
 
 class AESFSMMonitor:
@@ -94,43 +111,60 @@ class AESFSMMonitor:
     WAIT_MEMWR = 8
     COMPLETE = 9
     
-    STATE_NAMES = {
-        READY: "READY",
-        RDKEY: "RDKEY",
-        WAIT_RDKEY: "WAIT_RDKEY",
-        RDTEXT: "RDTEXT",
-        WAIT_RDTXT: "WAIT_RDTXT",
-        HASHOP: "HASHOP",
-        WAIT_HASHOP: "WAIT_HASHOP",
-        MEMWR: "MEMWR",
-        WAIT_MEMWR: "WAIT_MEMWR",
-        COMPLETE: "COMPLETE"
-    }
+    # Indexed by state encoding, which runs contiguously from READY to COMPLETE
+    STATE_NAMES = (
+        "READY",
+        "RDKEY",
+        "WAIT_RDKEY",
+        "RDTEXT",
+        "WAIT_RDTXT",
+        "HASHOP",
+        "WAIT_HASHOP",
+        "MEMWR",
+        "WAIT_MEMWR",
+        "COMPLETE",
+    )
     
     def __init__(self, dut):
         self.dut = dut.dut  # Access the actual DUT inside the testbench
+        self._state = self.dut.state
+        self._data_out = self.dut.data_out
         self.ADDRW = 24
         
     def get_state(self):
         """Get current FSM state"""
-        return int(self.dut.state.value)
+        return self._state.value.integer
         
     def get_state_name(self):
         """Get current FSM state name"""
         state = self.get_state()
-        return self.STATE_NAMES.get(state, f"UNKNOWN({state})")
+        if state < len(self.STATE_NAMES):
+            return self.STATE_NAMES[state]
+        return f"UNKNOWN({state})"
         
     async def wait_for_state(self, expected_state, timeout_cycles=100):
         """Wait for FSM to reach expected state"""
-        for _ in range(timeout_cycles):
-            if self.get_state() == expected_state:
-                return True
-            await RisingEdge(self.dut.clk)
-        return False
+        # Sleep on changes of the state register instead of sampling it on
+        # every clock edge; it only changes on clk edges anyway
+        if self.get_state() == expected_state:
+            return True
+
+        async def state_reached():
+            while self.get_state() != expected_state:
+                await Edge(self._state)
+
+        try:
+            await with_timeout(state_reached(), timeout_cycles * CLK_PERIOD_NS, "ns")
+        except SimTimeoutError:
+            return False
+        # The old per-clock poll only saw the new state on the clk edge after
+        # it changed; step to that edge so callers keep that timing
+        await RisingEdge(self.dut.clk)
+        return True
         
     def parse_data_out(self):
         """Parse data_out into address and control fields"""
-        data = int(self.dut.data_out.value)
+        data = self._data_out.value.integer
         addr = (data >> 8) & ((1 << self.ADDRW) - 1)
         ctrl = data & 0xFF
         return addr, ctrl
@@ -139,9 +173,6 @@ class AESFSMMonitor:
 @cocotb.test()
 async def test_reset(dut):
     """Test reset behavior"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = AESFSMDriver(dut)
     monitor = AESFSMMonitor(dut)
     
@@ -160,9 +191,6 @@ async def test_reset(dut):
 @cocotb.test()
 async def test_single_transaction(dut):
     """Test complete AES transaction: READY → RDKEY → RDTEXT → HASH → WRITE → COMPLETE"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = AESFSMDriver(dut)
     monitor = AESFSMMonitor(dut)
     
@@ -189,7 +217,7 @@ async def test_single_transaction(dut):
     # Check data_out for RDKEY command
     addr, ctrl = monitor.parse_data_out()
     assert addr == key_addr, f"RDKEY address mismatch: got 0x{addr:06X}, expected 0x{key_addr:06X}"
-    dut._log.info(f"RDKEY: addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("RDKEY: addr=0x%06X, ctrl=0x%02X", addr, ctrl)
     
     # Grant bus
     await driver.grant_bus()
@@ -209,7 +237,7 @@ async def test_single_transaction(dut):
     # Check data_out for RDTEXT command
     addr, ctrl = monitor.parse_data_out()
     assert addr == text_addr, f"RDTEXT address mismatch: got 0x{addr:06X}, expected 0x{text_addr:06X}"
-    dut._log.info(f"RDTEXT: addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("RDTEXT: addr=0x%06X, ctrl=0x%02X", addr, ctrl)
     
     # Grant bus
     await driver.grant_bus()
@@ -224,9 +252,9 @@ async def test_single_transaction(dut):
     assert monitor.get_state() == monitor.HASHOP, f"Expected HASHOP, got {monitor.get_state_name()}"
     assert dut.arb_req.value == 1, "arb_req should be asserted in HASHOP"
     try:
-        dut._log.info(f"HASHOP: data_out=0x{int(dut.data_out.value):08X}")
+        dut._log.debug("HASHOP: data_out=0x%08X", dut.data_out.value.integer)
     except ValueError:
-        dut._log.info(f"HASHOP: data_out has x values (expected during transition)")
+        dut._log.debug("HASHOP: data_out has x values (expected during transition)")
     
     # Grant bus
     await driver.grant_bus()
@@ -244,7 +272,7 @@ async def test_single_transaction(dut):
     # Check data_out for MEMWR command
     addr, ctrl = monitor.parse_data_out()
     assert addr == result_addr, f"MEMWR address mismatch: got 0x{addr:06X}, expected 0x{result_addr:06X}"
-    dut._log.info(f"MEMWR: addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("MEMWR: addr=0x%06X, ctrl=0x%02X", addr, ctrl)
     
     # Grant bus
     await driver.grant_bus()
@@ -258,8 +286,8 @@ async def test_single_transaction(dut):
     await RisingEdge(dut.clk)
     assert monitor.get_state() == monitor.COMPLETE, f"Expected COMPLETE, got {monitor.get_state_name()}"
     assert dut.valid_compq_out.value == 1, "valid_compq_out should be asserted in COMPLETE"
-    assert int(dut.compq_data_out.value) == result_addr, f"compq_data_out mismatch"
-    dut._log.info(f"COMPLETE: compq_data=0x{int(dut.compq_data_out.value):06X}")
+    assert dut.compq_data_out.value.integer == result_addr, f"compq_data_out mismatch"
+    dut._log.debug("COMPLETE: compq_data=0x%06X", dut.compq_data_out.value.integer)
     
     # Completion queue accepts
     await RisingEdge(dut.clk)
@@ -274,9 +302,6 @@ async def test_single_transaction(dut):
 @cocotb.test()
 async def test_backpressure_on_bus(dut):
     """Test FSM behavior when bus arbiter delays grant"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = AESFSMDriver(dut)
     monitor = AESFSMMonitor(dut)
     
@@ -315,9 +340,6 @@ async def test_backpressure_on_bus(dut):
 @cocotb.test()
 async def test_completion_queue_backpressure(dut):
     """Test FSM behavior when completion queue is not ready"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = AESFSMDriver(dut)
     monitor = AESFSMMonitor(dut)
     
@@ -357,11 +379,17 @@ async def test_completion_queue_backpressure(dut):
     assert monitor.get_state() == monitor.COMPLETE, "Should reach COMPLETE"
     assert dut.valid_compq_out.value == 1, "valid_compq_out should be asserted"
     
-    # FSM should remain in COMPLETE while backpressure is applied
-    for i in range(5):
-        await RisingEdge(dut.clk)
-        assert monitor.get_state() == monitor.COMPLETE, f"Should remain in COMPLETE during backpressure (cycle {i})"
-        assert dut.valid_compq_out.value == 1, "valid_compq_out should remain asserted"
+    # FSM should remain in COMPLETE while backpressure is applied. Watch the
+    # state register for any change over the next 5 clk edges (the window
+    # ends mid-cycle, after the 5th edge) instead of sampling every cycle;
+    # valid_compq_out decodes from state, so it holds with it
+    try:
+        await with_timeout(Edge(monitor._state), 5 * CLK_PERIOD_NS + CLK_PERIOD_NS // 2, "ns")
+    except SimTimeoutError:
+        pass
+    else:
+        raise AssertionError(f"Should remain in COMPLETE during backpressure, got {monitor.get_state_name()}")
+    assert dut.valid_compq_out.value == 1, "valid_compq_out should remain asserted"
     
     # Release backpressure
     dut._log.info("Releasing completion queue backpressure")
@@ -378,9 +406,6 @@ async def test_completion_queue_backpressure(dut):
 @cocotb.test()
 async def test_multiple_transactions(dut):
     """Test multiple back-to-back transactions"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = AESFSMDriver(dut)
     monitor = AESFSMMonitor(dut)
     
@@ -390,7 +415,7 @@ async def test_multiple_transactions(dut):
     
     async def run_transaction(key_addr, text_addr, result_addr):
         """Helper to run a complete transaction"""
-        dut._log.info(f"Transaction: key=0x{key_addr:06X}, text=0x{text_addr:06X}, result=0x{result_addr:06X}")
+        dut._log.debug("Transaction: key=0x%06X, text=0x%06X, result=0x%06X", key_addr, text_addr, result_addr)
         
         await driver.send_request(key_addr, text_addr, result_addr)
         
@@ -421,7 +446,7 @@ async def test_multiple_transactions(dut):
         # COMPLETE
         await RisingEdge(dut.clk)
         assert monitor.get_state() == monitor.COMPLETE
-        assert int(dut.compq_data_out.value) == result_addr
+        assert dut.compq_data_out.value.integer == result_addr
         
         # Return to READY
         await RisingEdge(dut.clk)
@@ -439,9 +464,6 @@ async def test_multiple_transactions(dut):
 @cocotb.test()
 async def test_reset_during_operation(dut):
     """Test reset assertion during active operation"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = AESFSMDriver(dut)
     monitor = AESFSMMonitor(dut)
     
@@ -475,9 +497,6 @@ async def test_reset_during_operation(dut):
 @cocotb.test()
 async def test_data_output_format(dut):
     """Verify data_out formatting for each operation type"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = AESFSMDriver(dut)
     monitor = AESFSMMonitor(dut)
     
@@ -495,9 +514,9 @@ async def test_data_output_format(dut):
     # Check RDKEY data format
     await RisingEdge(dut.clk)
     assert monitor.get_state() == monitor.RDKEY
-    data_out = int(dut.data_out.value)
+    data_out = dut.data_out.value.integer
     addr, ctrl = monitor.parse_data_out()
-    dut._log.info(f"RDKEY: data_out=0x{data_out:08X}, addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("RDKEY: data_out=0x%08X, addr=0x%06X, ctrl=0x%02X", data_out, addr, ctrl)
     assert addr == key_addr, "RDKEY address mismatch"
     # Control format: [1:0]=00 (reserved), [3:2]=MEM_ID, [5:4]=ACCEL_ID, [7:6]=00 (read key op)
     
@@ -507,9 +526,9 @@ async def test_data_output_format(dut):
     # Check RDTEXT data format
     await RisingEdge(dut.clk)
     assert monitor.get_state() == monitor.RDTEXT
-    data_out = int(dut.data_out.value)
+    data_out = dut.data_out.value.integer
     addr, ctrl = monitor.parse_data_out()
-    dut._log.info(f"RDTEXT: data_out=0x{data_out:08X}, addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("RDTEXT: data_out=0x%08X, addr=0x%06X, ctrl=0x%02X", data_out, addr, ctrl)
     assert addr == text_addr, "RDTEXT address mismatch"
     
     await driver.grant_bus()
@@ -519,10 +538,10 @@ async def test_data_output_format(dut):
     await RisingEdge(dut.clk)
     assert monitor.get_state() == monitor.HASHOP
     try:
-        data_out = int(dut.data_out.value)
-        dut._log.info(f"HASHOP: data_out=0x{data_out:08X}")
+        data_out = dut.data_out.value.integer
+        dut._log.debug("HASHOP: data_out=0x%08X", data_out)
     except ValueError:
-        dut._log.info(f"HASHOP: data_out has x values (acceptable during transition)")
+        dut._log.debug("HASHOP: data_out has x values (acceptable during transition)")
     # Should contain hash_mode bit
     
     await driver.grant_bus()
@@ -531,9 +550,9 @@ async def test_data_output_format(dut):
     # Check MEMWR data format
     await RisingEdge(dut.clk)
     assert monitor.get_state() == monitor.MEMWR
-    data_out = int(dut.data_out.value)
+    data_out = dut.data_out.value.integer
     addr, ctrl = monitor.parse_data_out()
-    dut._log.info(f"MEMWR: data_out=0x{data_out:08X}, addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("MEMWR: data_out=0x%08X, addr=0x%06X, ctrl=0x%02X", data_out, addr, ctrl)
     assert addr == result_addr, "MEMWR address mismatch"
     
     dut._log.info("✓ Data output format test passed")
@@ -542,9 +561,6 @@ async def test_data_output_format(dut):
 @cocotb.test()
 async def test_req_valid_hold(dut):
     """Test that req_valid can be held high across multiple cycles"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = AESFSMDriver(dut)
     monitor = AESFSMMonitor(dut)
     
@@ -1,6 +1,5 @@
 import cocotb
-from cocotb.triggers import RisingEdge, FallingEdge, Timer
-from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, RisingEdge, Timer
 
 
 async def reset_dut(dut):
@@ -11,17 +10,16 @@ async def reset_dut(dut):
     dut.aes_data_in.value = 0
     dut.sha_data_in.value = 0
     dut.bus_ready.value = 1
-    await Timer(100, units="ns")
+    # Count the hold in clocks so the release always lands on a clk edge
+    await ClockCycles(dut.clk, 3)
     dut.rst_n.value = 1
     await RisingEdge(dut.clk)
-    await RisingEdge(dut.clk)
-    dut._log.info("Reset complete.")
+    dut._log.debug("Reset complete.")
 
 
 @cocotb.test()
 async def test_basic_requests(dut):
     """Verify AES-only and SHA-only requests are granted properly."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
     await reset_dut(dut)
 
     # ------------------ AES ONLY ------------------
@@ -35,8 +33,7 @@ async def test_basic_requests(dut):
     assert dut.data_out.value == 0xDD, "Expected low byte of AES data"
     await RisingEdge(dut.clk)
     assert dut.data_out.value == 0xCC, "Expected second byte of AES data"
-    # Clear request
-    await reset_dut(dut)
+    # Clear request; the arbiter finishes the burst and goes idle
     dut.aes_req.value = 0
     await Timer(40, units="ns")
 
@@ -47,8 +44,8 @@ async def test_basic_requests(dut):
     await RisingEdge(dut.clk)
     await RisingEdge(dut.clk)
 
-    print(f"Mode = {dut.curr_mode_top.value}")
-    print(f"Counter = {dut.counter_top.value}")
+    dut._log.debug("Mode = %s", dut.curr_mode_top.value)
+    dut._log.debug("Counter = %s", dut.counter_top.value)
     await RisingEdge(dut.clk)
     assert dut.aes_grant.value == 0, "AES grant should be low"
     assert dut.sha_grant.value == 1, "SHA grant should be high"
@@ -60,7 +57,6 @@ async def test_basic_requests(dut):
 @cocotb.test()
 async def test_round_robin(dut):
     """Verify round-robin alternation between AES and SHA when both request simultaneously."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
     await reset_dut(dut)
 
     # ---------------- Simultaneous Requests #1 ----------------
@@ -72,25 +68,26 @@ async def test_round_robin(dut):
 
     await RisingEdge(dut.clk)
     await RisingEdge(dut.clk)
-    first_aes = bool(dut.aes_grant.value)
-    first_sha = bool(dut.sha_grant.value)
+    first_aes = dut.aes_grant.value.integer == 1
+    first_sha = dut.sha_grant.value.integer == 1
     assert first_aes != first_sha, "Only one grant expected in RR arbitration"
 
     first_src = "AES" if first_aes else "SHA"
-    dut._log.info(f"First grant: {first_src}")
+    dut._log.debug("First grant: %s", first_src)
 
-    # Wait for one transfer burst (4 cycles)
-    for _ in range(4):
-        await RisingEdge(dut.clk)
+    # Wait for one transfer burst (4 cycles). The timer ends mid-cycle, so the
+    # RisingEdge after it is the fourth clock edge
+    await Timer(35, units="ns")
+    await RisingEdge(dut.clk)
 
     # ---------------- Simultaneous Requests #2 ----------------
     dut.aes_data_in.value = 0xFACEFEED
     dut.sha_data_in.value = 0x0BADF00D
     await RisingEdge(dut.clk)
 
-    second_aes = bool(dut.aes_grant.value)
+    second_aes = dut.aes_grant.value.integer == 1
     second_src = "AES" if second_aes else "SHA"
-    dut._log.info(f"Second grant: {second_src}")
+    dut._log.debug("Second grant: %s", second_src)
 
     assert second_src != first_src, "Round-robin failed to alternate source"
 
@@ -102,22 +99,28 @@ async def test_round_robin(dut):
 @cocotb.test()
 async def test_data_transfer(dut):
     """Verify correct byte sequencing for a granted source."""
-    cocotb.start_soon(Clock(dut.clk, 10, units="ns").start())
     await reset_dut(dut)
 
     dut._log.info("=== TEST4: Data transfer byte sequencing ===")
+    test_data = 0x12345678
     dut.aes_req.value = 1
-    dut.aes_data_in.value = 0x12345678
+    dut.aes_data_in.value = test_data
+
+    # Bind the handles once for the byte loop
+    clk = dut.clk
+    valid_out = dut.valid_out
+    data_out = dut.data_out
 
     observed = []
-    await RisingEdge(dut.clk)
+    await RisingEdge(clk)
     for _ in range(4):
-        await RisingEdge(dut.clk)
-        if dut.valid_out.value:
-            observed.append(int(dut.data_out.value))
+        await RisingEdge(clk)
+        if valid_out.value:
+            observed.append(data_out.value.integer)
 
-    expected = [0x78, 0x56, 0x34, 0x12]
-    dut._log.info(f"Observed bytes: {observed}, Expected: {expected}")
+    # The arbiter sends the word low byte first
+    expected = list(test_data.to_bytes(4, "little"))
+    dut._log.info("Observed bytes: %s, Expected: %s", observed, expected)
     assert observed == expected, "Byte order mismatch in data_out sequence"
 
     await RisingEdge(dut.clk)
@@ -2,13 +2,15 @@
 Cocotb testbench for sha_fsm module
 Tests FSM state transitions, request/completion queues, and bus arbiter interactions
 SHA has simpler sequence (no RDKEY): READY → RDTEXT → HASH → WRITE → COMPLETE
+Runs on Icarus by default; `make test-sha-fsm SIM=verilator` is the faster option
 """
 
 import cocotb
-from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge, ClockCycles, Timer
-from cocotb.types import LogicArray
-import random
+from cocotb.result import SimTimeoutError
+from cocotb.triggers import RisingEdge, ClockCycles, Edge, with_timeout
+
+
+CLK_PERIOD_NS = 10  # clk period generated by sha_fsm_tb.v
 
 
 class SHAFSMDriver:
@@ -16,69 +18,87 @@ class SHAFSMDriver:
     
     def __init__(self, dut):
         self.dut = dut
+        # Resolve each handle once instead of on every access
+        self._clk = dut.clk
+        self._rst_n = dut.rst_n
+        self._req_valid = dut.req_valid
+        self._req_data = dut.req_data
+        self._compq_ready_in = dut.compq_ready_in
+        self._arb_req = dut.arb_req
+        self._arb_grant = dut.arb_grant
+        self._ack_in = dut.ack_in
         self.ADDRW = 24
         self.ACCEL_ID = 0b01
         self.MEM_ID = 0b00
+        # ack_in words, {1'b1, source ID}
+        self._mem_ack = (1 << 2) | self.MEM_ID
+        self._accel_ack = (1 << 2) | self.ACCEL_ID
         
     async def reset(self):
         """Perform reset sequence"""
-        self.dut.rst_n.value = 0
-        self.dut.req_valid.value = 0
-        self.dut.req_data.value = 0
-        self.dut.compq_ready_in.value = 1
-        self.dut.arb_grant.value = 0
-        self.dut.ack_in.value = 0
-        await ClockCycles(self.dut.clk, 5)
-        self.dut.rst_n.value = 1
-        await ClockCycles(self.dut.clk, 2)
+        self._rst_n.value = 0
+        self._req_valid.value = 0
+        self._req_data.value = 0
+        self._compq_ready_in.value = 1
+        self._arb_grant.value = 0
+        self._ack_in.value = 0
+        # sha_fsm clears its registers as soon as rst_n falls, so two clocks
+        # of hold are plenty
+        await ClockCycles(self._clk, 2)
+        self._rst_n.value = 1
+        await ClockCycles(self._clk, 2)
         
     def pack_request(self, text_addr, result_addr, hash_mode=0):
         """Pack addresses into req_data format [2*ADDRW+1:0]"""
-        # req_data = {text_addr[23:0], result_addr[23:0], hash_mode[1:0]}
-        # For ADDRW=24: [49:0] = {text_addr[23:0], result_addr[23:0], hash_mode[1:0]}
-        req_data = (text_addr << self.ADDRW) | result_addr | (hash_mode << 48)
+        # req_data = {hash_mode, 1'b0, text_addr[23:0], result_addr[23:0]}
+        # sha_fsm reads the hash mode from the top bit, req_data[2*ADDRW+1]
+        req_data = (text_addr << self.ADDRW) | result_addr | (hash_mode << (2*self.ADDRW + 1))
         return req_data
         
     async def send_request(self, text_addr, result_addr, hash_mode=0):
         """Send a request to the FSM"""
         req_data = self.pack_request(text_addr, result_addr, hash_mode)
-        self.dut.req_data.value = req_data
-        self.dut.req_valid.value = 1
-        await RisingEdge(self.dut.clk)
+        self._req_data.value = req_data
+        self._req_valid.value = 1
+        await RisingEdge(self._clk)
         # Wait for FSM to acknowledge (when it leaves READY state or loads data)
-        await RisingEdge(self.dut.clk)
+        await RisingEdge(self._clk)
         # Clear req_valid so FSM can complete and return to READY
-        self.dut.req_valid.value = 0
+        self._req_valid.value = 0
         
     async def clear_request(self):
         """Clear request valid signal"""
-        self.dut.req_valid.value = 0
-        await RisingEdge(self.dut.clk)
+        self._req_valid.value = 0
+        await RisingEdge(self._clk)
         
     async def grant_bus(self):
         """Grant bus access when arbiter request is asserted"""
-        while self.dut.arb_req.value == 0:
-            await RisingEdge(self.dut.clk)
-        self.dut.arb_grant.value = 1
-        await RisingEdge(self.dut.clk)
-        self.dut.arb_grant.value = 0
+        # Sleep until arb_req rises instead of polling it every clock, then
+        # take the next clk edge: the old poll could only see the rise there,
+        # so the grant keeps its timing
+        if self._arb_req.value == 0:
+            await RisingEdge(self._arb_req)
+            await RisingEdge(self._clk)
+        self._arb_grant.value = 1
+        await RisingEdge(self._clk)
+        self._arb_grant.value = 0
         
     async def send_mem_ack(self):
         """Send ACK from memory (ack_in = {1'b1, MEM_ID})"""
-        self.dut.ack_in.value = (1 << 2) | self.MEM_ID
-        await RisingEdge(self.dut.clk)
-        self.dut.ack_in.value = 0
+        self._ack_in.value = self._mem_ack
+        await RisingEdge(self._clk)
+        self._ack_in.value = 0
         
     async def send_accel_ack(self):
         """Send ACK from accelerator (ack_in = {1'b1, ACCEL_ID})"""
-        self.dut.ack_in.value = (1 << 2) | self.ACCEL_ID
-        await RisingEdge(self.dut.clk)
-        self.dut.ack_in.value = 0
+        self._ack_in.value = self._accel_ack
+        await RisingEdge(self._clk)
+        self._ack_in.value = 0
         
     async def set_compq_ready(self, ready):
         """Set completion queue ready signal"""
-        self.dut.compq_ready_in.value = ready
-        await RisingEdge(self.dut.clk)
+        self._compq_ready_in.value = ready
+        await RisingEdge(self._clk)
 
 
 class SHAFSMMonitor:
@@ -107,11 +127,13 @@ class SHAFSMMonitor:
     
     def __init__(self, dut):
         self.dut = dut.dut  # Access the actual DUT inside the testbench
+        self._state = self.dut.state
+        self._data_out = self.dut.data_out
         self.ADDRW = 24
         
     def get_state(self):
         """Get current FSM state"""
-        return int(self.dut.state.value)
+        return self._state.value.integer
         
     def get_state_name(self):
         """Get current FSM state name"""
@@ -120,15 +142,27 @@ class SHAFSMMonitor:
         
     async def wait_for_state(self, expected_state, timeout_cycles=100):
         """Wait for FSM to reach expected state"""
-        for _ in range(timeout_cycles):
-            if self.get_state() == expected_state:
-                return True
-            await RisingEdge(self.dut.clk)
-        return False
+        # Sleep on changes of the state register instead of sampling it on
+        # every clock edge; it only changes on clk edges anyway
+        if self.get_state() == expected_state:
+            return True
+
+        async def state_reached():
+            while self.get_state() != expected_state:
+                await Edge(self._state)
+
+        try:
+            await with_timeout(state_reached(), timeout_cycles * CLK_PERIOD_NS, "ns")
+        except SimTimeoutError:
+            return False
+        # The old per-clock poll only saw the new state on the clk edge after
+        # it changed; step to that edge so callers keep that timing
+        await RisingEdge(self.dut.clk)
+        return True
         
     def parse_data_out(self):
         """Parse data_out into address and control fields"""
-        data = int(self.dut.data_out.value)
+        data = self._data_out.value.integer
         addr = (data >> 8) & ((1 << self.ADDRW) - 1)
         ctrl = data & 0xFF
         return addr, ctrl
@@ -137,9 +171,6 @@ class SHAFSMMonitor:
 @cocotb.test()
 async def test_reset(dut):
     """Test reset behavior"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = SHAFSMDriver(dut)
     monitor = SHAFSMMonitor(dut)
     
@@ -158,9 +189,6 @@ async def test_reset(dut):
 @cocotb.test()
 async def test_single_transaction(dut):
     """Test complete SHA transaction: READY → RDTEXT → HASH → WRITE → COMPLETE"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = SHAFSMDriver(dut)
     monitor = SHAFSMMonitor(dut)
     
@@ -185,12 +213,12 @@ async def test_single_transaction(dut):
     # Actually looking at the state machine, there's a typo: "if (req_valid) next_state = RDKEY;"
     # But RDKEY doesn't exist in SHA. This is probably meant to be RDTEXT.
     # For now, I'll test assuming state value 1 (RDTEXT)
-    dut._log.info(f"After req_valid: state={monitor.get_state_name()}")
+    dut._log.debug("After req_valid: state=%s", monitor.get_state_name())
     
     # The FSM might be buggy - let me check state transitions
     await RisingEdge(dut.clk)
     current_state = monitor.get_state()
-    dut._log.info(f"Current state: {monitor.get_state_name()} (value={current_state})")
+    dut._log.debug("Current state: %s (value=%s)", monitor.get_state_name(), current_state)
     
     # FSM should be requesting bus
     assert dut.arb_req.value == 1, "arb_req should be asserted in RDTEXT"
@@ -198,14 +226,14 @@ async def test_single_transaction(dut):
     # Check data_out for RDTEXT command
     addr, ctrl = monitor.parse_data_out()
     assert addr == text_addr, f"RDTEXT address mismatch: got 0x{addr:06X}, expected 0x{text_addr:06X}"
-    dut._log.info(f"RDTEXT: addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("RDTEXT: addr=0x%06X, ctrl=0x%02X", addr, ctrl)
     
     # Grant bus
     await driver.grant_bus()
     
     # FSM should move to WAIT_RDTXT
     await RisingEdge(dut.clk)
-    dut._log.info(f"After grant: state={monitor.get_state_name()}")
+    dut._log.debug("After grant: state=%s", monitor.get_state_name())
     assert monitor.get_state() == monitor.WAIT_RDTXT, f"Expected WAIT_RDTXT, got {monitor.get_state_name()}"
     
     # Send memory ACK
@@ -215,7 +243,7 @@ async def test_single_transaction(dut):
     await RisingEdge(dut.clk)
     assert monitor.get_state() == monitor.HASHOP, f"Expected HASHOP, got {monitor.get_state_name()}"
     assert dut.arb_req.value == 1, "arb_req should be asserted in HASHOP"
-    dut._log.info(f"HASHOP: data_out=0x{int(dut.data_out.value):08X}")
+    dut._log.debug("HASHOP: data_out=0x%08X", int(dut.data_out.value))
     
     # Grant bus
     await driver.grant_bus()
@@ -233,7 +261,7 @@ async def test_single_transaction(dut):
     # Check data_out for MEMWR command
     addr, ctrl = monitor.parse_data_out()
     assert addr == result_addr, f"MEMWR address mismatch: got 0x{addr:06X}, expected 0x{result_addr:06X}"
-    dut._log.info(f"MEMWR: addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("MEMWR: addr=0x%06X, ctrl=0x%02X", addr, ctrl)
     
     # Grant bus
     await driver.grant_bus()
@@ -248,7 +276,7 @@ async def test_single_transaction(dut):
     assert monitor.get_state() == monitor.COMPLETE, f"Expected COMPLETE, got {monitor.get_state_name()}"
     assert dut.valid_compq_out.value == 1, "valid_compq_out should be asserted in COMPLETE"
     assert int(dut.compq_data_out.value) == result_addr, f"compq_data_out mismatch"
-    dut._log.info(f"COMPLETE: compq_data=0x{int(dut.compq_data_out.value):06X}")
+    dut._log.debug("COMPLETE: compq_data=0x%06X", int(dut.compq_data_out.value))
     
     # Completion queue accepts
     await RisingEdge(dut.clk)
@@ -263,9 +291,6 @@ async def test_single_transaction(dut):
 @cocotb.test()
 async def test_backpressure_on_bus(dut):
     """Test FSM behavior when bus arbiter delays grant"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = SHAFSMDriver(dut)
     monitor = SHAFSMMonitor(dut)
     
@@ -305,9 +330,6 @@ async def test_backpressure_on_bus(dut):
 @cocotb.test()
 async def test_completion_queue_backpressure(dut):
     """Test FSM behavior when completion queue is not ready"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = SHAFSMDriver(dut)
     monitor = SHAFSMMonitor(dut)
     
@@ -343,11 +365,17 @@ async def test_completion_queue_backpressure(dut):
     assert monitor.get_state() == monitor.COMPLETE, "Should reach COMPLETE"
     assert dut.valid_compq_out.value == 1, "valid_compq_out should be asserted"
     
-    # FSM should remain in COMPLETE while backpressure is applied
-    for i in range(5):
-        await RisingEdge(dut.clk)
-        assert monitor.get_state() == monitor.COMPLETE, f"Should remain in COMPLETE during backpressure (cycle {i})"
-        assert dut.valid_compq_out.value == 1, "valid_compq_out should remain asserted"
+    # FSM should remain in COMPLETE while backpressure is applied. Watch the
+    # state register for any change over the next 5 clk edges (the window
+    # ends mid-cycle, after the 5th edge) instead of sampling every cycle;
+    # valid_compq_out decodes from state, so it holds with it
+    try:
+        await with_timeout(Edge(monitor._state), 5 * CLK_PERIOD_NS + CLK_PERIOD_NS // 2, "ns")
+    except SimTimeoutError:
+        pass
+    else:
+        raise AssertionError(f"Should remain in COMPLETE during backpressure, got {monitor.get_state_name()}")
+    assert dut.valid_compq_out.value == 1, "valid_compq_out should remain asserted"
     
     # Release backpressure
     dut._log.info("Releasing completion queue backpressure")
@@ -364,9 +392,6 @@ async def test_completion_queue_backpressure(dut):
 @cocotb.test()
 async def test_multiple_transactions(dut):
     """Test multiple back-to-back transactions"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = SHAFSMDriver(dut)
     monitor = SHAFSMMonitor(dut)
     
@@ -376,7 +401,7 @@ async def test_multiple_transactions(dut):
     
     async def run_transaction(text_addr, result_addr):
         """Helper to run a complete transaction"""
-        dut._log.info(f"Transaction: text=0x{text_addr:06X}, result=0x{result_addr:06X}")
+        dut._log.debug("Transaction: text=0x%06X, result=0x%06X", text_addr, result_addr)
         
         await driver.send_request(text_addr, result_addr)
         
@@ -417,9 +442,6 @@ async def test_multiple_transactions(dut):
 @cocotb.test()
 async def test_reset_during_operation(dut):
     """Test reset assertion during active operation"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = SHAFSMDriver(dut)
     monitor = SHAFSMMonitor(dut)
     
@@ -454,9 +476,6 @@ async def test_reset_during_operation(dut):
 @cocotb.test()
 async def test_comparison_with_aes(dut):
     """Verify SHA is faster than AES (fewer states)"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = SHAFSMDriver(dut)
     monitor = SHAFSMMonitor(dut)
     
@@ -503,9 +522,6 @@ async def test_comparison_with_aes(dut):
 @cocotb.test()
 async def test_data_output_format(dut):
     """Verify data_out formatting for each operation type"""
-    clock = Clock(dut.clk, 10, units="ns")
-    cocotb.start_soon(clock.start())
-    
     driver = SHAFSMDriver(dut)
     monitor = SHAFSMMonitor(dut)
     
@@ -524,7 +540,7 @@ async def test_data_output_format(dut):
     await RisingEdge(dut.clk)
     data_out = int(dut.data_out.value)
     addr, ctrl = monitor.parse_data_out()
-    dut._log.info(f"RDTEXT: data_out=0x{data_out:08X}, addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("RDTEXT: data_out=0x%08X, addr=0x%06X, ctrl=0x%02X", data_out, addr, ctrl)
     assert addr == text_addr, "RDTEXT address mismatch"
     
     await driver.grant_bus()
@@ -533,7 +549,8 @@ async def test_data_output_format(dut):
     # Check HASHOP data format
     await RisingEdge(dut.clk)
     data_out = int(dut.data_out.value)
-    dut._log.info(f"HASHOP: data_out=0x{data_out:08X}")
+    dut._log.debug("HASHOP: data_out=0x%08X", data_out)
+    assert (data_out >> 7) & 1 == hash_mode, "HASHOP hash_mode bit mismatch"
     
     await driver.grant_bus()
     await driver.send_accel_ack()
@@ -542,7 +559,7 @@ async def test_data_output_format(dut):
     await RisingEdge(dut.clk)
     data_out = int(dut.data_out.value)
     addr, ctrl = monitor.parse_data_out()
-    dut._log.info(f"MEMWR: data_out=0x{data_out:08X}, addr=0x{addr:06X}, ctrl=0x{ctrl:02X}")
+    dut._log.debug("MEMWR: data_out=0x%08X, addr=0x%06X, ctrl=0x%02X", data_out, addr, ctrl)
     assert addr == result_addr, "MEMWR address mismatch"
     
     dut._log.info("✓ Data output format test passed")
\ No newline at end of file